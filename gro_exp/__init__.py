@@ -1,5 +1,11 @@
+import gro_exp.gro as gro
+import gro_exp.select as select
+import gro_exp.xvg as xvg
+import gro_exp.stats as stats
+import gro_exp.cache as cache
+import gro_exp.analysis as analysis
 import gro_exp.utils as utils
 import gro_exp.ddb as ddb
 
 
-__all__ = ["utils", "ddb"]
+__all__ = ["gro", "select", "xvg", "stats", "cache", "analysis", "utils", "ddb"]
@@ -0,0 +1,538 @@
+import os
+import re
+import tempfile
+import numpy as np
+
+from gro_exp.gro import GroTrajectory
+from gro_exp.select import masses, residue_starts, residue_centers, _axis
+
+
+# Atomic mass unit per cubic nanometer in kg m^-3
+AMU_NM3 = 1.66053906660
+
+
+def _trajectory(traj):
+    """Trajectory object of a file link or trajectory."""
+    return GroTrajectory(traj) if isinstance(traj, str) else traj
+
+
+def _frame_time(title):
+    """Simulation time of a frame title written by Gromacs (t= ...)."""
+    match = re.search(r"t=\s*([-+0-9.eE]+)", title)
+    return float(match.group(1)) if match else None
+
+
+def _resname_mask(atoms, resname):
+    """Atoms of the residue names, all atoms if no name is given."""
+    if resname is None:
+        return np.ones(atoms.size, dtype=bool)
+    resname = [resname] if isinstance(resname, str) else resname
+    return np.isin(np.char.strip(atoms["resname"]), resname)
+
+
+def unwrap(pos, box):
+    """
+    Remove jumps over periodic boundaries from positions over time. Between
+    two frames particles are assumed to move less than half a box length.
+
+    Parameters
+    ----------
+    pos : ndarray
+        positions of shape (frames, particles, 3)
+    box : ndarray
+        rectangular box lengths of each frame (frames, 3) or of all frames
+
+    Returns
+    -------
+    pos : ndarray
+        continuous positions starting at the positions of the first frame
+    """
+    pos = np.asarray(pos, dtype=np.float64)
+    lengths = np.asarray(box, dtype=np.float64)[..., :3]
+    lengths = lengths[1:, None, :] if lengths.ndim == 2 else lengths
+
+    diff = np.diff(pos, axis=0)
+    diff -= lengths * np.round(diff/lengths)
+    return np.concatenate((pos[:1], pos[:1] + np.cumsum(diff, axis=0)))
+
+
+def _msd_fft(pos):
+    """Mean square displacement of each particle for all lag times with the
+    FFT algorithm, positions of shape (frames, particles, 3)."""
+    num_frames = pos.shape[0]
+    lags = num_frames - np.arange(num_frames)
+
+    # Sum of the squared positions at both ends of the lag
+    square = np.concatenate((np.zeros((1, pos.shape[1])), np.cumsum(np.sum(pos**2, axis=2), axis=0)))
+    lag = np.arange(num_frames)
+    s1 = (2*square[-1] - square[lag] - (square[-1] - square[num_frames-lag])) / lags[:, None]
+
+    # Position autocorrelation
+    spectrum = np.fft.rfft(pos, n=2*num_frames, axis=0)
+    s2 = np.sum(np.fft.irfft(spectrum*np.conj(spectrum), axis=0)[:num_frames], axis=2) / lags[:, None]
+
+    return np.maximum(s1 - 2*s2, 0)
+
+
+def msd_fft(traj, resname=None, com=False, mass={}, dt=None, chunk_size=1000, per_particle=False, tmp_dir=None):
+    """
+    Mean square displacement from a multi-frame structure file with the FFT
+    algorithm in O(T log T) per particle, as alternative to ``gmx msd``.
+    Positions are unwrapped over periodic boundaries frame by frame into a
+    temporary file next to the trajectory and the MSD is calculated for chunks of particles, so
+    that only the positions of one chunk over all frames are held in
+    memory. The result can be passed to :func:`gro_exp.utils.msd_fit`.
+
+    Parameters
+    ----------
+    traj : string, GroTrajectory
+        link to a multi-frame gro file or trajectory object
+    resname : string, list, optional
+        residue names of the particles, default all atoms
+    com : bool, optional
+        True to calculate the MSD of the residue centers of mass
+    mass : dictionary, optional
+        masses by atom name for the centers of mass, see
+        :func:`gro_exp.select.masses`
+    dt : float, optional
+        time between frames in ps, default the time of the frame titles
+    chunk_size : integer, optional
+        number of particles read from the temporary file and transformed
+        at once
+    per_particle : bool, optional
+        True to additionally return the MSD of each particle
+    tmp_dir : string, optional
+        directory of the temporary file, default the directory of the
+        trajectory
+
+    Returns
+    -------
+    time : ndarray
+        lag time in ps
+    msd : ndarray
+        mean square displacement averaged over the particles in nm^2
+    msd_particle : ndarray
+        mean square displacement of shape (lag times, particles), only if
+        per particle is set
+    """
+    traj = _trajectory(traj)
+    num_frames = len(traj)
+    if not num_frames:
+        raise ValueError("No frames in trajectory")
+
+    if tmp_dir is None:
+        tmp_dir = os.path.dirname(os.path.abspath(traj._filename))
+
+    with tempfile.TemporaryFile(dir=tmp_dir) as file_tmp:
+        # Unwrapped positions of all frames in a temporary file
+        pos, times = None, []
+        for frame, (title, atoms, frame_box) in enumerate(traj):
+            if pos is None:
+                select = _resname_mask(atoms, resname)
+                starts = residue_starts(atoms[select]) if com else None
+            atoms = atoms[select]
+            frame_pos = np.asarray(residue_centers(atoms, frame_box, mass, starts) if com else atoms["pos"], dtype=np.float64)
+            if pos is None:
+                shape = (num_frames,) + frame_pos.shape
+                pos = np.memmap(file_tmp, dtype=np.float64, mode="w+", shape=shape) if frame_pos.size else np.empty(shape)
+                current = frame_pos.copy()
+            else:
+                # Displacement since the previous frame
+                current += unwrap((previous, frame_pos), frame_box)[1] - previous
+            pos[frame] = current
+            previous = frame_pos
+            times.append(_frame_time(title))
+
+        # Lag times
+        if dt is None and None not in times and len(times) > 1:
+            dt = times[1] - times[0]
+        time = np.arange(num_frames) * (1 if dt is None else dt)
+
+        # MSD for chunks of particles
+        msd = np.zeros(num_frames)
+        msd_particle = []
+        for start in range(0, pos.shape[1], chunk_size):
+            msd_chunk = _msd_fft(np.array(pos[:, start:start+chunk_size]))
+            msd += np.sum(msd_chunk, axis=1)
+            if per_particle:
+                msd_particle.append(msd_chunk)
+        msd /= max(pos.shape[1], 1)
+        del pos
+
+    if per_particle:
+        return time, msd, np.concatenate(msd_particle, axis=1)
+    return time, msd
+
+
+class DensityProfile:
+    """
+    Mass density profile along a box axis or radially around an axis,
+    accumulated frame by frame. Atoms are binned with ``np.bincount``
+    weighted by their masses. Axial bins are relative to the box length of
+    each frame, so the box may change between frames. Selection and masses
+    are determined once and reused for frames with the same number of
+    atoms.
+
+    Parameters
+    ----------
+    axis : string, integer, optional
+        box axis of the profile, or of the cylinder for radial profiles
+    bins : integer, optional
+        number of bins
+    resname : string, list, optional
+        residue names of the atoms, default all atoms
+    mass : dictionary, optional
+        masses by atom name, see :func:`gro_exp.select.masses`
+    radial : bool, optional
+        True for a radial profile around the axis
+    center : list, optional
+        center of the radial profile in the plane perpendicular to the axis,
+        default the box center
+    radius : float, optional
+        maximal radius of the radial profile, default half of the smallest
+        perpendicular box length of the first frame
+
+    Examples
+    --------
+    .. code-block:: python
+
+        profile = DensityProfile("z", bins=200, resname="SOL")
+        for title, atoms, box in GroTrajectory("traj.gro"):
+            profile.update(atoms, box)
+        length, density, density_mean = profile.result()
+    """
+    def __init__(self, axis="z", bins=100, resname=None, mass={}, radial=False, center=None, radius=None):
+        self.axis = _axis(axis)
+        self.bins = bins
+        self.resname = resname
+        self.mass = mass
+        self.radial = radial
+        self.center = center
+        self.radius = radius
+        self.num_frames = 0
+        self._density = np.zeros(bins)
+        self._length = 0
+        self._topology = None
+
+    def _weights(self, atoms):
+        """Selection and masses of the atoms, reused while the number of
+        atoms does not change."""
+        if self._topology is None or self._topology[0] != atoms.size:
+            select = _resname_mask(atoms, self.resname)
+            select = slice(None) if np.all(select) else select
+            self._topology = (atoms.size, select, masses(atoms["atomname"][select], self.mass))
+        return self._topology[1], self._topology[2]
+
+    def update(self, atoms, box):
+        """
+        Add the atoms of a frame to the profile.
+
+        Parameters
+        ----------
+        atoms : ndarray
+            structured atom array, see :func:`gro_exp.gro.read_gro`
+        box : list
+            box vector, only the rectangular box lengths are used
+        """
+        select, weights = self._weights(atoms)
+        pos = atoms["pos"][select]
+        lengths = np.asarray(box, dtype=np.float64)[:3]
+
+        if self.radial:
+            # Distance from the axis with minimum image convention
+            plane = [i for i in range(3) if i != self.axis]
+            if self.radius is None:
+                self.radius = np.min(lengths[plane])/2
+            center = lengths[plane]/2 if self.center is None else np.asarray(self.center, dtype=np.float64)
+            diff = pos[:, plane] - center
+            diff -= lengths[plane]*np.round(diff/lengths[plane])
+            index = (np.sqrt(np.sum(diff**2, axis=1))/self.radius*self.bins).astype(np.int64)
+            inside = index < self.bins
+            edges = np.linspace(0, self.radius, self.bins+1)
+            volume = np.pi*np.diff(edges**2)*lengths[self.axis]
+            self._density += np.bincount(index[inside], weights[inside], self.bins)/volume
+            self._length = self.radius
+        else:
+            # Relative position along the axis, wrapped into the box
+            index = np.floor(pos[:, self.axis]/lengths[self.axis]*self.bins).astype(np.int64) % self.bins
+            volume = np.prod(lengths)/self.bins
+            self._density += np.bincount(index, weights, self.bins)/volume
+            self._length += lengths[self.axis]
+
+        self.num_frames += 1
+
+    def result(self):
+        """
+        Density profile averaged over all frames.
+
+        Returns
+        -------
+        length : ndarray
+            bin centers along the box length (mean box length) or radius
+        density : ndarray
+            mass density in kg m^-3
+        dens_mean : float
+            mean density over the bins
+        """
+        if not self.num_frames:
+            raise ValueError("No frames added to the density profile")
+        length = self._length if self.radial else self._length/self.num_frames
+        density = self._density/self.num_frames*AMU_NM3
+        return (np.arange(self.bins)+0.5)*length/self.bins, density, np.mean(density)
+
+
+def density_profile(traj, axis="z", bins=100, resname=None, mass={}, radial=False, center=None, radius=None):
+    """
+    Mass density profile of a structure file or trajectory, see
+    :class:`DensityProfile`. The result has the same form as
+    :func:`gro_exp.utils.density`.
+
+    Parameters
+    ----------
+    traj : string, GroTrajectory, list
+        link to a (multi-frame) gro file, trajectory object or list of atom
+        arrays and box vectors
+    axis : string, integer, optional
+        box axis of the profile, or of the cylinder for radial profiles
+    bins : integer, optional
+        number of bins
+    resname : string, list, optional
+        residue names of the atoms, default all atoms
+    mass : dictionary, optional
+        masses by atom name, see :func:`gro_exp.select.masses`
+    radial : bool, optional
+        True for a radial profile around the axis
+    center : list, optional
+        center of the radial profile, default the box center
+    radius : float, optional
+        maximal radius of the radial profile
+
+    Returns
+    -------
+    length : ndarray
+        bin centers along the box length or radius
+    density : ndarray
+        mass density in kg m^-3
+    dens_mean : float
+        mean density over the bins
+    """
+    profile = DensityProfile(axis, bins, resname, mass, radial, center, radius)
+    for frame in _trajectory(traj):
+        profile.update(*frame[-2:])
+    return profile.result()
+
+
+def _molecules(atoms, resname, mass):
+    """Selection, first atom of each molecule, molecule index of each atom
+    and masses of the selected atoms."""
+    select = _resname_mask(atoms, resname)
+    select = slice(None) if np.all(select) else select
+    starts = residue_starts(atoms[select])
+    index = np.repeat(np.arange(starts.size), np.diff(np.append(starts, atoms[select].size)))
+    return select, starts, index, masses(atoms["atomname"][select], mass)
+
+
+def _whole(pos, starts, index, box):
+    """Make molecules broken over periodic boundaries whole by chaining the
+    minimum image vectors between consecutive atoms of a molecule."""
+    cumsum = np.zeros(pos.shape)
+    diff = np.subtract(pos[1:], pos[:-1], out=cumsum[1:])
+    if box is not None:
+        lengths = np.asarray(box, dtype=np.float64)[:3]
+        diff -= lengths*np.round(diff/lengths)
+    np.cumsum(cumsum, axis=0, out=cumsum)
+    cumsum += (pos[starts] - cumsum[starts])[index]
+    return cumsum
+
+
+def iter_gyration(traj, resname=None, mass={}):
+    """
+    Radius of gyration of all molecules frame by frame. Molecules are
+    separated where the residue number changes and are made whole over
+    periodic boundaries along their atom order. Centers of mass and radii
+    are calculated for all molecules at once with ``np.add.reduceat``.
+    Molecules are determined once and reused for frames with the same number
+    of atoms.
+
+    Parameters
+    ----------
+    traj : string, GroTrajectory, list
+        link to a (multi-frame) gro file, trajectory object or list of atom
+        arrays and box vectors
+    resname : string, list, optional
+        residue names of the molecules, default all residues
+    mass : dictionary, optional
+        masses by atom name, see :func:`gro_exp.select.masses`
+
+    Yields
+    ------
+    time : float
+        simulation time of the frame title, None if not given
+    gyration : ndarray
+        radius of gyration of each molecule in nm
+    """
+    topology = None
+    for frame in _trajectory(traj):
+        title, atoms, box = frame if len(frame) == 3 else (None, *frame)
+        if topology is None or topology[0] != atoms.size:
+            topology = (atoms.size,) + _molecules(atoms, resname, mass)
+        select, starts, index, weights = topology[1:]
+
+        # Centers of mass of the whole molecules
+        pos = _whole(atoms["pos"][select], starts, index, box)
+        total = np.add.reduceat(weights, starts)
+        centers = np.add.reduceat(pos*weights[:, None], starts)/total[:, None]
+
+        # Mass weighted mean square distance from the center
+        square = np.sum((pos-centers[index])**2, axis=1)
+        yield (None if title is None else _frame_time(title)), np.sqrt(np.add.reduceat(square*weights, starts)/total)
+
+
+def gyration(traj, resname=None, mass={}):
+    """
+    Radius of gyration of all molecules over all frames, see
+    :func:`iter_gyration`.
+
+    Parameters
+    ----------
+    traj : string, GroTrajectory, list
+        link to a (multi-frame) gro file, trajectory object or list of atom
+        arrays and box vectors
+    resname : string, list, optional
+        residue names of the molecules, default all residues
+    mass : dictionary, optional
+        masses by atom name, see :func:`gro_exp.select.masses`
+
+    Returns
+    -------
+    time : ndarray
+        simulation time of each frame, frame number if not given
+    gyration : ndarray
+        radius of gyration of shape (frames, molecules) in nm
+    gyration_mean : ndarray
+        mean radius of gyration of each frame in nm
+    """
+    times, gyration = [], []
+    for time, frame_gyration in iter_gyration(traj, resname, mass):
+        times.append(len(times) if time is None else time)
+        gyration.append(frame_gyration)
+    gyration = np.array(gyration)
+
+    return np.array(times, dtype=np.float64), gyration, np.mean(gyration, axis=1)
+
+
+class ProfileQuery:
+    """
+    Interval queries on a density profile or a stack of profiles. Cumulative
+    sums are built once, every interval is then answered in constant time
+    for all profiles at once.
+
+    Parameters
+    ----------
+    length : ndarray
+        bin centers in increasing order, e.g. from :func:`gro_exp.utils.density`
+    density : ndarray
+        profile values with the bins along the first axis, further axes for
+        several profiles, e.g. data sets or replicas
+
+    Examples
+    --------
+    .. code-block:: python
+
+        length, density, density_mean = gro_exp.utils.density("density.xvg", series="all")
+        query = ProfileQuery(length, density)
+        means = query.mean([[0, 2], [2, 4], [4, 6]])
+    """
+    def __init__(self, length, density):
+        self.length = np.asarray(length, dtype=np.float64)
+        self.density = np.asarray(density, dtype=np.float64)
+        if self.length.size < 2:
+            raise ValueError("Profile needs at least two bins")
+
+        # Bin edges halfway between the centers
+        centers = self.length
+        mid = (centers[1:]+centers[:-1])/2
+        self.edges = np.concatenate(([2*centers[0]-mid[0]], mid, [2*centers[-1]-mid[-1]]))
+        widths = np.diff(self.edges)
+        self._uniform = np.allclose(widths, widths[0])
+
+        # Cumulative integral at the edges and cumulative sum of the bins
+        shape = (self.density.ndim-1)*(1,)
+        zero = np.zeros((1,)+self.density.shape[1:])
+        self._integral = np.concatenate((zero, np.cumsum(self.density*widths.reshape((-1,)+shape), axis=0)))
+        self._sum = np.concatenate((zero, np.cumsum(self.density, axis=0)))
+
+    def _intervals(self, intervals):
+        """Lower and upper bounds of one or several intervals."""
+        intervals = np.asarray(intervals, dtype=np.float64)
+        return intervals.reshape(-1, 2)[:, 0], intervals.reshape(-1, 2)[:, 1], intervals.ndim == 1
+
+    def _bin(self, x):
+        """Bin index of positions, clipped to the profile."""
+        if self._uniform:
+            index = np.floor((x-self.edges[0])/(self.edges[1]-self.edges[0])).astype(np.int64)
+            index = np.clip(index, 0, self.length.size-1)
+            index -= x < self.edges[index]
+            index += x >= self.edges[np.minimum(index+1, self.length.size)]
+        else:
+            index = np.searchsorted(self.edges, x, side="right")-1
+        return np.clip(index, 0, self.length.size-1)
+
+    def _cumulative(self, x):
+        """Integral of the profile from the first edge up to positions."""
+        x = np.clip(x, self.edges[0], self.edges[-1])
+        index = self._bin(x)
+        shape = (-1,)+(self.density.ndim-1)*(1,)
+        return self._integral[index]+self.density[index]*(x-self.edges[index]).reshape(shape)
+
+    def integral(self, intervals):
+        """
+        Exact integral of the piecewise constant profile over intervals,
+        bins are weighted by their fraction inside the interval.
+
+        Parameters
+        ----------
+        intervals : list
+            interval [a, b] or list of intervals
+
+        Returns
+        -------
+        integral : ndarray
+            integral of each interval and profile
+        """
+        lower, upper, single = self._intervals(intervals)
+        integral = self._cumulative(upper)-self._cumulative(lower)
+        return integral[0] if single else integral
+
+    def mean(self, intervals, exact=True):
+        """
+        Mean of the profile over intervals.
+
+        Parameters
+        ----------
+        intervals : list
+            interval [a, b] or list of intervals
+        exact : bool, optional
+            True for the exact mean of the piecewise constant profile over the
+            part of the interval inside the profile, False for the mean of
+            the bins with the center in (a, b] as in
+            :func:`gro_exp.utils.density`
+
+        Returns
+        -------
+        mean : ndarray
+            mean of each interval and profile, NaN for intervals without
+            width or bins inside the profile
+        """
+        lower, upper, single = self._intervals(intervals)
+        shape = (-1,)+(self.density.ndim-1)*(1,)
+        if exact:
+            width = np.clip(upper, self.edges[0], self.edges[-1])-np.clip(lower, self.edges[0], self.edges[-1])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                mean = (self._cumulative(upper)-self._cumulative(lower))/width.reshape(shape)
+        else:
+            start = np.searchsorted(self.length, lower, side="right")
+            end = np.searchsorted(self.length, upper, side="right")
+            with np.errstate(divide="ignore", invalid="ignore"):
+                mean = (self._sum[end]-self._sum[start])/(end-start).reshape(shape)
+        return mean[0] if single else mean
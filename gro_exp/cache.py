@@ -0,0 +1,222 @@
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+import numpy as np
+
+import gro_exp.gro as gro
+import gro_exp.xvg as xvg
+
+
+# Parser versions, increase to invalidate cached entries of a parser
+VERSION = {"xvg": 1, "gro": 1}
+
+
+class Cache:
+    """
+    Opt-in on-disk cache of parsed xvg and gro files. Parsed arrays are
+    stored as ``.npy`` files with the remaining header information pickled
+    next to them. Entries are keyed by the file path, size and modification
+    time (or a hash of the content) and the parser version, so changed files
+    are parsed again. Repeated loads are memory-mapped reads, the most recent
+    results are additionally kept in memory. Returned arrays are read-only.
+
+    Parameters
+    ----------
+    directory : string, optional
+        cache directory, default **gro_exp** in the user cache directory
+    max_size : integer, optional
+        maximal size of the cache directory in bytes, least recently used
+        entries are removed
+    memory_items : integer, optional
+        number of results kept in memory
+    content_hash : bool, optional
+        True to key the entries by a hash of the file content instead of
+        path, size and modification time
+
+    Examples
+    --------
+    .. code-block:: python
+
+        gro_exp.cache.enable(max_size=2**32)
+        gro_exp.utils.density("density.xvg")  # parsed and stored
+        gro_exp.utils.density("density.xvg")  # memory-mapped
+    """
+    def __init__(self, directory=None, max_size=2**30, memory_items=16, content_hash=False):
+        if directory is None:
+            directory = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "gro_exp")
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.max_size = max_size
+        self.memory_items = memory_items
+        self.content_hash = content_hash
+        self._memory = collections.OrderedDict()
+
+    def _key(self, filename, kind, options=""):
+        """Key of a parsed file."""
+        key = hashlib.sha1()
+        if self.content_hash:
+            with open(filename, "rb") as file_in:
+                for block in iter(lambda: file_in.read(2**24), b""):
+                    key.update(block)
+        else:
+            stat = os.stat(filename)
+            key.update(("%s %i %i" % (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)).encode())
+        key.update(("%s %i %s" % (kind, VERSION[kind], options)).encode())
+        return kind + "_" + key.hexdigest()
+
+    def _load(self, filename, kind, options, parse):
+        """Parsed file from memory, disk or the parser. The parser returns
+        an array and picklable header information."""
+        key = self._key(filename, kind, options)
+
+        # Memory
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        # Disk
+        link = os.path.join(self.directory, key)
+        try:
+            data = np.load(link + ".npy", mmap_mode="r")
+            with open(link + ".pkl", "rb") as file_in:
+                header = pickle.load(file_in)
+            os.utime(link + ".npy")
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            data, header = parse()
+            self._store(link, data, header)
+            data.flags.writeable = False
+
+        # Keep in memory
+        self._memory[key] = (data, header)
+        if len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+        return data, header
+
+    def _store(self, link, data, header):
+        """Write an entry atomically and evict old entries."""
+        for ext, write in ((".pkl", lambda f: pickle.dump(header, f)), (".npy", lambda f: np.save(f, data))):
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as file_out:
+                write(file_out)
+            os.replace(file_out.name, link + ext)
+        self.evict()
+
+    def evict(self, max_size=None):
+        """
+        Remove least recently used entries until the cache directory is not
+        larger than the maximal size.
+
+        Parameters
+        ----------
+        max_size : integer, optional
+            size in bytes, default the maximal size of the cache
+        """
+        max_size = self.max_size if max_size is None else max_size
+
+        # Entries with size and last access
+        entries = {}
+        for entry in os.scandir(self.directory):
+            key, ext = os.path.splitext(entry.name)
+            if ext in (".npy", ".pkl"):
+                stat = entry.stat()
+                size, used = entries.get(key, (0, 0))
+                entries[key] = (size+stat.st_size, max(used, stat.st_mtime_ns))
+
+        # Remove oldest entries
+        size = sum(entry[0] for entry in entries.values())
+        for key in sorted(entries, key=lambda key: entries[key][1]):
+            if size <= max_size:
+                break
+            for ext in (".npy", ".pkl"):
+                if os.path.exists(os.path.join(self.directory, key + ext)):
+                    os.remove(os.path.join(self.directory, key + ext))
+            self._memory.pop(key, None)
+            size -= entries[key][0]
+
+    def clear(self):
+        """Remove all entries."""
+        self.evict(0)
+        self._memory.clear()
+
+    def read_xvg(self, filename):
+        """
+        Cached :func:`gro_exp.xvg.read_xvg`.
+
+        Parameters
+        ----------
+        filename : string
+            link to the xvg file
+
+        Returns
+        -------
+        data : ndarray
+            array with one row per data line and one column per value
+        meta : XvgMeta
+            header information
+        """
+        return self._load(filename, "xvg", "", lambda: xvg.read_xvg(filename))
+
+    def read_gro(self, filename, velocities=None):
+        """
+        Cached :func:`gro_exp.gro.read_gro`.
+
+        Parameters
+        ----------
+        filename : string
+            link to the gro file
+        velocities : bool, optional
+            True to read velocities, default if present in the file
+
+        Returns
+        -------
+        title : string
+            title line
+        atoms : ndarray
+            structured atom array
+        box : ndarray
+            box vectors
+        """
+        def parse():
+            title, atoms, box = gro.read_gro(filename, velocities)
+            return atoms, (title, box)
+
+        atoms, (title, box) = self._load(filename, "gro", str(velocities), parse)
+        return title, atoms, box
+
+
+# Cache used by the analysis functions
+_active = None
+
+
+def enable(directory=None, max_size=2**30, memory_items=16, content_hash=False):
+    """
+    Enable the cache for the analysis functions of :mod:`gro_exp.utils`.
+    Arguments are passed to :class:`Cache`.
+
+    Returns
+    -------
+    cache : Cache
+        active cache
+    """
+    global _active
+    _active = Cache(directory, max_size, memory_items, content_hash)
+    return _active
+
+
+def disable():
+    """Disable the cache for the analysis functions."""
+    global _active
+    _active = None
+
+
+def read_xvg(filename):
+    """:func:`gro_exp.xvg.read_xvg` through the cache if enabled."""
+    return _active.read_xvg(filename) if _active is not None else xvg.read_xvg(filename)
+
+
+def read_gro(filename, velocities=None):
+    """:func:`gro_exp.gro.read_gro` through the cache if enabled."""
+    return _active.read_gro(filename, velocities) if _active is not None else gro.read_gro(filename, velocities)
@@ -1,3 +1,4 @@
+import concurrent.futures
 import glob                        # use linux wildcard syntax
 import numpy as np
 import sys
@@ -5,17 +6,323 @@ import pickle
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
+import re
 
+import gro_exp.gro as gro
 
-def read_exp(filename, prop, temp, press=None, tol_temp=0, tol_p=0, p_nan=False, is_plot=False, is_print=False, area=[], is_ref=True):
+
+# Schema version of the cached tables, increase to invalidate cached files
+CACHE_VERSION = 1
+
+# Default dtype of string columns in this pandas version
+_STRING = pd.Series([""]).dtype
+
+# Author in a DDB citation, e.g. "Tugarev I.A." or "Le Fevre C. G."
+_AUTHOR = re.compile(r"^[^,.]+? [A-ZÀ-Þ]\w{0,2}(?:[.\- ]{1,2}[A-ZÀ-Þ]\w{0,2})*\.?$")
+
+
+def _authors(citation):
+    """Leading authors of a citation."""
+    authors = []
+    for part in citation.split(", "):
+        if not _AUTHOR.match(part.strip()):
+            break
+        authors.append(part.strip())
+    return authors
+
+
+class DDBDataset:
+    """
+    Experimental data of a DDB Excel file parsed once. The workbook is split
+    into the table of values and the table of references, temperature,
+    pressure and property columns are converted to numbers. Any number of
+    temperature and pressure queries are then answered from memory.
+
+    The parsed tables can be cached in a columnar NumPy ``.npz`` file, either
+    next to the workbook as ``<filename>.ddb.npz`` or in a cache directory.
+    The cache is rebuilt if size or modification time of the workbook or the
+    schema version changed, otherwise the Excel file is not parsed at all.
+    String columns are restored with missing entries as NaN.
+
+    Parameters
+    ----------
+    filename : string
+        Link to the DDB Excel file
+    cache : bool, string, optional
+        True to cache next to the workbook, link to a cache directory or
+        False to always parse the workbook
+
+    Attributes
+    ----------
+    values : obj
+        Pandas DataFrame with the data points
+    references : obj
+        Pandas DataFrame indexed by the data set number with the citation,
+        the list of authors and the year of each reference
+    units : dictionary
+        unit of each column given in the file
+
+    Examples
+    --------
+    .. code-block:: python
+
+        dataset = DDBDataset("benzene_exp_density.xls", cache=True)
+        for temp in temp_vec:
+            table = dataset.query("DEN", temp, 101325, tol_temp=0.2)
+    """
+    def __init__(self, filename, cache=False):
+        self.filename = filename
+        self._cache = cache
+
+        # Parse the workbook unless cached
+        if not (cache and self._load_cache()):
+            self._parse()
+            if cache:
+                self._save_cache()
+
+    def _parse(self):
+        """Read the tables of the Excel file."""
+        # Read excel data file
+        filename = self.filename
+        df_all = pd.read_excel(filename)
+
+        # Read units and drop first row
+        self.units = {column: unit for column, unit in df_all.iloc[0].items() if isinstance(unit, str)}
+        df_all = df_all.drop(index=0)
+
+        # Values table up to the first row without temperature
+        rows_with_nan = df_all[df_all["T"].isnull()].index.tolist()
+        end = rows_with_nan[0] if rows_with_nan else df_all.index[-1]+1
+        self.values = df_all.loc[:end-1].copy()
+        for column in ["T", "P"] + list(self.units):
+            if column in self.values:
+                self.values[column] = pd.to_numeric(self.values[column], errors="coerce")
+
+        # Reference table
+        df_ref = df_all.loc[end:]
+        df_ref = df_ref[df_ref["PCP Data Set#"].notnull() & df_ref["T"].notnull()]
+        df_ref = df_ref.drop_duplicates("PCP Data Set#")
+        self._set_references(df_ref["PCP Data Set#"].astype(float).values, df_ref["T"].astype(str).str.split("] ").str[1].values)
+
+    def _set_references(self, numbers, citations):
+        """Reference table with authors and year split out."""
+        citation = pd.Series(citations, dtype=object)
+        self.references = pd.DataFrame({"Citation": citation.values,
+                                        "Authors": citation.map(_authors).values,
+                                        "Year": pd.to_numeric(citation.str.extract(r"\b(1[6-9]\d\d|20\d\d)\D*$")[0]).astype("Int64").values},
+                                       index=pd.Index(numbers, name="PCP Data Set#"))
+
+    def _cache_link(self):
+        return gro._cache_file(self.filename, self._cache, ".ddb.npz")
+
+    def _load_cache(self):
+        """Restore the tables from the cache if it belongs to the current
+        file and schema version."""
+        data = gro._load_cache(self._cache_link(), gro._file_stat(self.filename, CACHE_VERSION))
+        if data is None:
+            return False
+        try:
+            self.units = dict(zip(data["unit_columns"].tolist(), data["units"].tolist()))
+            values = {}
+            for i, column in enumerate(data["columns"].tolist()):
+                column_data = data["c%i" % i]
+                if column_data.dtype.kind == "U":
+                    column_data = pd.Series(np.where(data["n%i" % i], np.nan, column_data.astype(object)), dtype=_STRING).values
+                values[column] = column_data
+            self.values = pd.DataFrame(values, index=data["index"])
+            self._set_references(data["ref_numbers"], data["citations"].astype(object))
+        except (KeyError, ValueError):
+            return False
+        return True
+
+    def _save_cache(self):
+        """Write the tables column by column, strings with a mask of the
+        missing entries."""
+        arrays = {"index": self.values.index.values.astype(np.int64),
+                  "columns": np.array(self.values.columns, dtype=str),
+                  "unit_columns": np.array(list(self.units), dtype=str), "units": np.array(list(self.units.values()), dtype=str),
+                  "ref_numbers": self.references.index.values.astype(float),
+                  "citations": np.asarray(self.references["Citation"], dtype=str)}
+        for i, column in enumerate(self.values.columns):
+            series = self.values[column]
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                arrays["c%i" % i] = series.values.astype(float)
+            else:
+                arrays["n%i" % i] = series.isnull().values
+                arrays["c%i" % i] = np.asarray(series.fillna("").astype(str), dtype=str)
+
+        gro._save_cache(self._cache_link(), gro._file_stat(self.filename, CACHE_VERSION), arrays)
+
+    @property
+    def properties(self):
+        """Property columns with a unit, e.g. DEN or DIF."""
+        return [column for column in self.units if column not in ("T", "P") and not column.startswith("±")]
+
+    def query(self, prop, temp, press=None, tol_temp=0, tol_p=0, p_nan=False, area=[]):
+        """
+        Data points of a property at a temperature and pressure.
+
+        Parameters
+        ----------
+        prop : string
+            property which you would like consider [DEN,DIF]
+        temp : float
+            desired temperature
+        press : float, optional
+            desired pressure
+        tol_temp : float, optional
+            tolerance for the target temperature
+        tol_p : float, optional
+            tolerance for target pressure
+        p_nan : bool, optional
+            consider all data points which has no specified pressure
+        area : list, optional
+            consider only the data in the specified area [a,b]
+
+        Returns
+        -------
+        table : obj
+            Pandas DataFrame with the selected data points
+        """
+        df = self.values
+
+        # Search for the desired temperature
+        mask = (df["T"] <= temp + tol_temp) & (df["T"] >= temp - tol_temp)
+        if area:
+            mask &= (df[prop] <= area[1]) & (df[prop] >= area[0])
+
+        # Search for the desired pressure
+        if press and "P" in df:
+            pressure = df["P"].fillna(press) if p_nan else df["P"]
+            mask &= (pressure <= press + tol_p) & (pressure >= press - tol_p)
+
+        table = df[mask].copy()
+        if press and "P" in df and p_nan:
+            table["P"] = table["P"].fillna(press)
+        return table
+
+    def query_grid(self, prop, temp_vec, press=None, tol_temp=0, tol_p=0, p_nan=False, area=[]):
+        """
+        Statistics of a property for all temperatures of a grid at once. The
+        data points are sorted by temperature and the tolerance windows of
+        all temperatures are found with ``np.searchsorted``, means and
+        standard deviations of all windows are reduced with ``np.bincount``.
+        The selection is the same as for :func:`read_exp`.
+
+        Parameters
+        ----------
+        prop : string
+            property which you would like consider [DEN,DIF]
+        temp_vec : list
+            desired temperatures
+        press : float, optional
+            desired pressure
+        tol_temp : float, optional
+            tolerance for the target temperatures
+        tol_p : float, optional
+            tolerance for target pressure
+        p_nan : bool, optional
+            consider all data points which has no specified pressure
+        area : list, optional
+            consider only the data in the specified area [a,b]
+
+        Returns
+        -------
+        mean : ndarray
+            mean property of each temperature, NaN without data points
+        std : ndarray
+            standard deviation of each temperature
+        count : ndarray
+            number of data points of each temperature
+        offsets : ndarray
+            data points of temperature i are index[offsets[i]:offsets[i+1]]
+        index : ndarray
+            row positions in the values table of the data points in table
+            order for each temperature
+        """
+        df = self.values
+        temp_vec = np.asarray(temp_vec, dtype=float)
+
+        # Temperature independent selection
+        mask = np.ones(df.shape[0], dtype=bool)
+        if area:
+            mask &= ((df[prop] <= area[1]) & (df[prop] >= area[0])).values
+        if press and "P" in df:
+            pressure = df["P"].fillna(press) if p_nan else df["P"]
+            mask &= ((pressure <= press + tol_p) & (pressure >= press - tol_p)).values
+        rows = np.flatnonzero(mask)
+
+        # Rows sorted by temperature
+        temp = df["T"].values[rows]
+        rows = rows[np.argsort(temp, kind="stable")]
+        temp = df["T"].values[rows]
+        values = df[prop].values[rows].astype(float)
+
+        # Tolerance windows of all temperatures
+        lower = np.searchsorted(temp, temp_vec - tol_temp, side="left")
+        upper = np.searchsorted(temp, temp_vec + tol_temp, side="right")
+        count = np.maximum(upper - lower, 0)
+        upper = lower + count
+
+        # Ragged members in table order
+        offsets = np.concatenate(([0], np.cumsum(count)))
+        group = np.repeat(np.arange(temp_vec.size), count)
+        members = np.repeat(lower - offsets[:-1], count) + np.arange(offsets[-1])
+        order = np.lexsort((rows[members], group))
+        members = members[order]
+
+        # Mean and standard deviation of all groups
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.bincount(group, values[members], temp_vec.size) / count
+            std = np.sqrt(np.bincount(group, (values[members] - mean[group])**2, temp_vec.size) / count)
+
+        return mean, std, count, offsets, rows[members]
+
+    def citation(self, number):
+        """
+        Citation of a data set without the leading data set number.
+
+        Parameters
+        ----------
+        number : float
+            data set number (Ref. Number column of the values)
+
+        Returns
+        -------
+        citation : string
+            authors, title and source of the reference
+        """
+        return self.references.at[number, "Citation"]
+
+    def cite(self, numbers):
+        """
+        References of many data points joined at once by their data set
+        number.
+
+        Parameters
+        ----------
+        numbers : list
+            data set number of each data point (Ref. Number column of the
+            values)
+
+        Returns
+        -------
+        references : obj
+            Pandas DataFrame with the citation, authors and year of each data
+            point in the given order, NaN for unknown data sets
+        """
+        return self.references.reindex(np.asarray(numbers, dtype=float))
+
+
+def read_exp(filename, prop, temp, press=None, tol_temp=0, tol_p=0, p_nan=False, is_plot=False, is_print=False, area=[], is_ref=True, is_verbose=False, cache=False):
     """
     This function can read a DBB Excel file and returns the desired mean
     property at the specified temperature.
 
     Parameters
     ----------
-    filename : string
-        Link to gromacs analyse output file
+    filename : string, DDBDataset
+        Link to the DDB Excel file or dataset parsed before
     prop : string
         property which you would like consider [DEN,DIF]
     temp : float
@@ -34,6 +341,12 @@ def read_exp(filename, prop, temp, press=None, tol_temp=0, tol_p=0, p_nan=False,
         print mean value, standard deviation and amount of data
     area : list, optional
         consider only the data in the specified area [a,b]
+    is_ref : bool, optional
+        read the data points and their references
+    is_verbose : bool, optional
+        print each selected data point
+    cache : bool, string, optional
+        cache of the parsed file, see :class:`DDBDataset`
 
     Returns
     -------
@@ -53,52 +366,24 @@ def read_exp(filename, prop, temp, press=None, tol_temp=0, tol_p=0, p_nan=False,
         Pandas DataFrame with the selected data points
     """
 
-    # Read excel data file
-    df_all = pd.read_excel(filename)
+    # Parse excel data file
+    dataset = filename if isinstance(filename, DDBDataset) else DDBDataset(filename, cache)
+    unit = dataset.units[prop]
 
-    # Read unit and drop first row
-    unit = df_all[prop][0]
-    df_all = df_all.drop(index=0)
-
-    # Cut off references
-    rows_with_nan = df_all[df_all['T'].isnull()].index.tolist()
-
-    # Reference Table
-    df_ref = df_all.truncate(before=int(rows_with_nan[0]))
-
-    # Valbool, optionalues table
-    df = df_all.truncate(after=int(rows_with_nan[0]))
-    pd.to_numeric(df['T'])
-
-    # Search for the desired temperature
-    df_woT = df[df['T'] <= (temp + tol_temp)]
-    df_woT = df_woT[df_woT['T'] >= (temp - tol_temp)]
-    if area:
-        df_woT = df_woT[df_woT[prop] <= area[1]]
-        df_woT = df_woT[df_woT[prop] >= area[0]]
-
-    # Search for the desired pressure
-    if press:
-        if "P" in df_woT:
-            pd.to_numeric(df['P'])
-            if p_nan:
-                df_woT['P'] = df_woT['P'].fillna(press)
-            df_woT = df_woT[df_woT['P'] <= (press + tol_p)]
-            df_woT = df_woT[df_woT['P'] >= (press - tol_p)]
+    # Search for the desired temperature and pressure
+    df_woT = dataset.query(prop, temp, press, tol_temp, tol_p, p_nan, area)
 
     # Write the prop in vector
-    data = df_woT.to_dict()
     prop_vec = []
     ref_vec = []
 
     # Read reference of the choosen data points
     if is_ref:
-        for i in (data[prop]):
-            print(data[prop][i])
-            prop_vec.append(float(data[prop][i]))
-            ref = df_ref[df_ref['PCP Data Set#'] == (data['Ref. Number'][i])]
-            ref = ref['T'].values[0]
-            ref_vec.append(ref.split("] ")[1])
+        prop_vec = df_woT[prop].astype(float).tolist()
+        ref_vec = dataset.cite(df_woT["Ref. Number"])["Citation"].tolist()
+        if is_verbose:
+            for value in prop_vec:
+                print(value)
     else:
         ref_vec = []
 
@@ -108,9 +393,9 @@ def read_exp(filename, prop, temp, press=None, tol_temp=0, tol_p=0, p_nan=False,
     # Plot selected data points
     if is_plot:
         plt.figure(figsize=(13, 4))
-        plt.title(filename)
+        plt.title(dataset.filename)
         plt.subplot(1, 2, 1)
-        sns.scatterplot(x=a['T'], y=prop_vec)
+        sns.scatterplot(x=df_woT['T'], y=prop_vec)
         plt.xlabel("T (K)")
         plt.ylabel(str(prop + " (" + unit + ")"))
         if press:
@@ -139,14 +424,14 @@ def read_exp(filename, prop, temp, press=None, tol_temp=0, tol_p=0, p_nan=False,
     #Return results
     return mean, std, unit, data_amount, prop_vec, ref_vec, table
 
-def read_exp_temp_vec(filename,temp_vec, prop, press, tol_temp=0.2,  tol_p = 10000, p_nan=True, is_plot=True, is_display=False):
+def read_exp_temp_vec(filename,temp_vec, prop, press, tol_temp=0.2,  tol_p = 10000, p_nan=True, is_plot=True, is_display=False, is_verbose=False, cache=False):
     """
     This function can read a DBB Excel file and returns the mean property of the specified temperatures.
 
     Parameters
     ----------
-    filename : string
-        Link to gromacs analyse output file
+    filename : string, DDBDataset
+        Link to the DDB Excel file or dataset parsed before
     temp : float
         desired temperature
     prop : string
@@ -163,6 +448,10 @@ def read_exp_temp_vec(filename,temp_vec, prop, press, tol_temp=0.2,  tol_p = 100
         plot the values
     is_display: bool, optional
         show pandas DataFrame
+    is_verbose : bool, optional
+        print each selected data point
+    cache : bool, string, optional
+        cache of the parsed file, see :class:`DDBDataset`
 
     Returns
     -------
@@ -177,14 +466,26 @@ def read_exp_temp_vec(filename,temp_vec, prop, press, tol_temp=0.2,  tol_p = 100
     num_data = []
     prop_dict = {}
     reference = []
-    for temp in temp_vec:
-        mean, std, unit, data_amount, prop_vec, ref_vec, table = read_exp(filename, prop, temp, press, tol_temp, tol_p, p_nan)
+    dataset = filename if isinstance(filename, DDBDataset) else DDBDataset(filename, cache)
+    unit = dataset.units[prop]
+
+    # Statistics of all temperatures at once
+    mean_vec, std_vec, count_vec, offsets, index = dataset.query_grid(prop, temp_vec, press, tol_temp, tol_p, p_nan)
+    values = dataset.values[prop].values[index].astype(float).tolist()
+    citations = dataset.cite(dataset.values["Ref. Number"].values[index])["Citation"].tolist()
+
+    for i, temp in enumerate(temp_vec):
+        prop_vec = values[offsets[i]:offsets[i+1]]
+        ref_vec = citations[offsets[i]:offsets[i+1]]
+        if is_verbose:
+            for value in prop_vec:
+                print(value)
         prop_dict[str(temp)] = {}
         prop_dict[str(temp)][prop] = prop_vec
         prop_dict[str(temp)]["Reference"] = ref_vec
-        data_prop.append(mean)
-        num_data.append(data_amount)
-        std_prop.append(std)
+        data_prop.append(mean_vec[i] if count_vec[i] else None)
+        num_data.append(int(count_vec[i]) if count_vec[i] else None)
+        std_prop.append(std_vec[i] if count_vec[i] else None)
         reference.append(ref_vec)
     if prop == "DIF":
         prop_dict[str(temp)][prop] = [value * 10 ** (-4) for value in prop_dict[str(temp)][prop]]
@@ -216,6 +517,116 @@ def read_exp_temp_vec(filename,temp_vec, prop, press, tol_temp=0.2,  tol_p = 100
 
     return data,prop_dict
 
+
+def _bulk_entries(filename, entries, cache):
+    """Grid statistics of all manifest entries of one file, failures are
+    returned as messages."""
+    rows = []
+    errors = []
+    try:
+        dataset = DDBDataset(filename, cache)
+    except Exception as e:
+        return rows, [(num, repr(e)) for num, entry in entries]
+
+    for num, entry in entries:
+        try:
+            prop = entry["prop"]
+            press = entry.get("press")
+            p_nan = entry.get("p_nan", True)
+            temp_vec = np.atleast_1d(np.asarray(entry["temp_vec"], dtype=float))
+            if prop not in dataset.values:
+                raise KeyError("No column " + str(prop) + " in " + filename)
+            if press and not p_nan and "P" not in dataset.values:
+                raise KeyError("No column P in " + filename)
+
+            mean, std, count, offsets, index = dataset.query_grid(prop, temp_vec, press, entry.get("tol_temp", 0.2), entry.get("tol_p", 10000), p_nan)
+            if np.isnan(dataset.values[prop].values[index].astype(float)).any():
+                raise ValueError("Non-numeric or missing " + str(prop) + " values in " + filename)
+            citations = dataset.cite(dataset.values["Ref. Number"].values[index])["Citation"].tolist()
+
+            # Same units as read_exp_temp_vec
+            unit = dataset.units[prop]
+            if prop == "DIF":
+                mean, std, unit = mean * 10 ** (-4), std * 10 ** (-4), "m^2/s"
+
+            for i, temp in enumerate(temp_vec):
+                rows.append((num, filename, prop, temp, press, mean[i], std[i], unit, int(count[i]), citations[offsets[i]:offsets[i+1]]))
+        except Exception as e:
+            errors.append((num, repr(e)))
+
+    return rows, errors
+
+
+def read_exp_bulk(manifest, workers=None, processes=True, cache=False):
+    """
+    This function reads the mean properties of many DDB files, properties
+    and temperature grids at once. Entries of the same file share one parsed
+    workbook, the files are processed concurrently. Failing entries, e.g.
+    a missing column or non-numeric values, are reported and do not stop the
+    other entries.
+
+    Parameters
+    ----------
+    manifest : list
+        list of dictionaries with the keys **filename**, **prop**,
+        **temp_vec** and optionally **press**, **tol_temp**, **tol_p** and
+        **p_nan** as for :func:`read_exp_temp_vec`
+    workers : integer, optional
+        number of processes or threads, default chosen by the executor
+    processes : bool, optional
+        True to parse in a process pool, False for a thread pool
+    cache : bool, string, optional
+        cache of the parsed files, see :class:`DDBDataset`
+
+    Returns
+    -------
+    table : obj
+        Pandas DataFrame with one row per entry and temperature containing
+        the mean property, standard deviation, unit, number of data points
+        and references, temperatures without data points have a NaN mean
+    errors : obj
+        Pandas DataFrame with the entry number, file, property and error
+        message of each failed entry
+
+    Examples
+    --------
+    .. code-block:: python
+
+        manifest = [{"filename": "benzene.xls", "prop": "DEN", "temp_vec": [288.15, 298.15], "press": 101325},
+                    {"filename": "formic_acid.xls", "prop": "DIF", "temp_vec": [298.15]}]
+        table, errors = read_exp_bulk(manifest)
+    """
+    if isinstance(manifest, pd.DataFrame):
+        manifest = manifest.to_dict("records")
+
+    # Entries grouped by file
+    files = {}
+    invalid = []
+    for num, entry in enumerate(manifest):
+        if isinstance(entry.get("filename"), str):
+            files.setdefault(entry["filename"], []).append((num, dict(entry)))
+        else:
+            invalid.append((num, repr(KeyError("No filename in manifest entry"))))
+
+    # Process files concurrently
+    executor = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+    with executor(workers) as pool:
+        futures = [pool.submit(_bulk_entries, filename, entries, cache) for filename, entries in files.items()]
+        results = [([], invalid)]
+        for future, (filename, entries) in zip(futures, files.items()):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(([], [(num, repr(e)) for num, entry in entries]))
+
+    # Long tables in manifest order
+    rows = sorted((row for result in results for row in result[0]), key=lambda row: row[0])
+    errors = sorted((error for result in results for error in result[1]), key=lambda error: error[0])
+    table = pd.DataFrame(rows, columns=["Entry", "File", "Property", "Temperature (K)", "Pressure (Pa)", "Mean", "STD", "Unit", "Number of data points", "References"])
+    errors = pd.DataFrame([(num, manifest[num].get("filename"), manifest[num].get("prop"), error) for num, error in errors], columns=["Entry", "File", "Property", "Error"])
+
+    return table, errors
+
 def drop_outliers(data,prop_dict,temp,area):
     """
     This function can be used remove the specified outliers from the mean property. Therefore, it will be specified a area in which the data points 
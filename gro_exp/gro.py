@@ -0,0 +1,772 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+def gro_dtype(velocities=False):
+    """
+    Structured data type of the atom array returned by :func:`read_gro`.
+
+    Parameters
+    ----------
+    velocities : bool, optional
+        True to add the velocity field
+
+    Returns
+    -------
+    dtype : numpy.dtype
+        data type with the fields resid, resname, atomname, atomid, pos
+        (x, y, z) and optionally vel (vx, vy, vz)
+    """
+    fields = [("resid", np.int32), ("resname", "U5"), ("atomname", "U5"),
+              ("atomid", np.int32), ("pos", np.float64, (3,))]
+    if velocities:
+        fields.append(("vel", np.float64, (3,)))
+    return np.dtype(fields)
+
+
+def _factorize(names):
+    """
+    Unique names in order of their first appearance and the index of each
+    name in them. ASCII names of up to five characters are compared as
+    integer keys.
+
+    Parameters
+    ----------
+    names : ndarray
+        names, e.g. atoms["resname"]
+
+    Returns
+    -------
+    uniques : ndarray
+        unique names in order of first appearance
+    inverse : ndarray
+        index of each name in the unique names
+    """
+    names = np.ascontiguousarray(names, dtype="U5")
+    codes = names.view(np.uint32).reshape(-1, 5)
+    if codes.size and codes.max() < 256:
+        keys = np.zeros(names.size, dtype=np.uint64)
+        for j in range(5):
+            keys |= codes[:, j].astype(np.uint64) << np.uint64(8*j)
+    else:
+        keys = names
+    first, inverse = np.unique(keys, return_index=True, return_inverse=True)[1:]
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+    return names[first[order]], rank[inverse.ravel()]
+
+
+def _column(block, start, stop):
+    """Return the fixed-width columns [start, stop) of a byte matrix as a
+    one dimensional byte string array."""
+    return np.ascontiguousarray(block[:, start:stop]).view("S%i" % (stop-start)).ravel()
+
+
+def _number(block, start, stop, dtype):
+    """
+    Convert the fixed-width columns [start, stop) of a byte matrix into
+    numbers. Right aligned integers and fixed-point decimals are assembled
+    digit by digit over whole columns, all other content falls back to the
+    NumPy string conversion.
+
+    Parameters
+    ----------
+    block : ndarray
+        uint8 matrix with one line per row
+    start : integer
+        first column
+    stop : integer
+        column after the last one
+    dtype : type
+        numpy.int32 or numpy.float64
+
+    Returns
+    -------
+    values : ndarray
+        converted numbers
+    """
+    cols = np.ascontiguousarray(block[:, start:stop].T)
+    is_digit = (cols >= 48) & (cols <= 57)
+    is_point = cols == 46
+    is_minus = cols == 45
+
+    # Decimal point has to be in the same column for all rows
+    points = np.flatnonzero(is_point[:, 0]) if block.shape[0] else []
+    fixed = len(points) <= 1 and (dtype is np.float64 or not len(points))
+    if fixed and len(points):
+        fixed = bool(is_point[points[0]].all()) and int(np.count_nonzero(is_point)) == block.shape[0]
+    if not fixed or not np.all(is_digit | is_point | is_minus | (cols == 32)):
+        return _column(block, start, stop).astype(dtype)
+
+    # Assemble integer from digits
+    value = np.zeros(block.shape[0], dtype=np.int64)
+    for j in range(stop-start):
+        if not len(points) or j != points[0]:
+            value *= 10
+            value += np.where(is_digit[j], cols[j]-48, 0)
+    negative = is_minus.any(axis=0)
+
+    # Sign applied after the conversion to keep negative zeros
+    if len(points):
+        value = value / 10.0**(stop-start-1-points[0])
+        return np.where(negative, -value, value)
+    value[negative] *= -1
+    return value.astype(dtype)
+
+
+def _field_width(line):
+    """Determine the coordinate field width of a .gro atom line from the
+    distance of the first two decimal points, as Gromacs does."""
+    first = line.find(b".", 20)
+    second = line.find(b".", first+1)
+    if first < 0 or second < 0:
+        return 8
+    return second - first
+
+
+def _line_length(buf, offset, num_lines):
+    """Return the common length of num_lines lines starting at offset, None
+    if the lines differ in length."""
+    length = int(np.argmax(buf[offset:offset+4096] == 10)) if num_lines else 0
+    end = offset + num_lines*(length+1)
+    if end <= buf.size and np.all(buf[offset+length:end:length+1] == 10):
+        return length
+    return None
+
+
+def _line_ends(buf, offset, num_lines):
+    """Return the newline positions of num_lines lines starting at offset."""
+    ends = []
+    num_found = 0
+    pos = offset
+    while num_found < num_lines:
+        chunk = buf[pos:pos+(1 << 24)]
+        if not chunk.size:
+            raise ValueError("Unexpected end of file after %i of %i lines" % (num_found, num_lines))
+        ends.append(np.flatnonzero(chunk == 10) + pos)
+        num_found += ends[-1].size
+        pos += chunk.size
+    return np.concatenate(ends)[:num_lines] if ends else np.empty(0, dtype=np.int64)
+
+
+def _skip_lines(buf, offset, num_lines):
+    """Return the position after num_lines lines starting at offset."""
+    length = _line_length(buf, offset, num_lines)
+    if length is not None:
+        return offset + num_lines*(length+1)
+    return int(_line_ends(buf, offset, num_lines)[-1]) + 1
+
+
+def _line_matrix(buf, offset, num_lines):
+    """
+    Split num_lines lines of a byte buffer into a zero padded matrix with
+    one line per row.
+
+    Parameters
+    ----------
+    buf : ndarray
+        uint8 view of the file
+    offset : integer
+        position of the first line in the buffer
+    num_lines : integer
+        number of lines
+
+    Returns
+    -------
+    block : ndarray
+        uint8 matrix with one line per row
+    end : integer
+        position after the last newline
+    """
+    # Equal line lengths (files written by Gromacs) are viewed without copy
+    length = _line_length(buf, offset, num_lines)
+    if length is not None:
+        end = offset + num_lines*(length+1)
+        return buf[offset:end].reshape(num_lines, length+1)[:, :length], end
+
+    # Varying line lengths
+    ends = _line_ends(buf, offset, num_lines)
+    starts = np.concatenate(([offset], ends[:-1]+1))
+    lengths = ends - starts
+    cols = np.arange(lengths.max())
+    index = np.minimum(starts[:, None] + cols, buf.size-1)
+    block = np.where(cols < lengths[:, None], buf[index], 0).astype(np.uint8)
+    return block, int(ends[-1]) + 1
+
+
+def _parse_atoms(buf, offset, num_atoms, width=None, velocities=None):
+    """
+    Parse a block of .gro atom lines in bulk.
+
+    Parameters
+    ----------
+    buf : ndarray
+        uint8 view of the file
+    offset : integer
+        position of the first atom line in the buffer
+    num_atoms : integer
+        number of atom lines to parse
+    width : integer, optional
+        coordinate field width, detected from the first line by default
+    velocities : bool, optional
+        True to read velocities, detected from the first line by default
+
+    Returns
+    -------
+    atoms : ndarray
+        structured atom array, see :func:`gro_dtype`
+    end : integer
+        position after the last atom line
+    """
+    block, end = _line_matrix(buf, offset, num_atoms)
+    first = block[0].tobytes().rstrip(b"\0\r ") if num_atoms else b""
+    width = _field_width(first) if width is None else width
+    if velocities is None:
+        velocities = len(first) >= 20+6*width
+
+    atoms = np.empty(num_atoms, dtype=gro_dtype(velocities))
+    if not num_atoms:
+        return atoms, end
+
+    atoms["resid"] = _number(block, 0, 5, np.int32)
+    atoms["resname"] = np.char.strip(_column(block, 5, 10)).astype("U5")
+    atoms["atomname"] = np.char.strip(_column(block, 10, 15)).astype("U5")
+    atoms["atomid"] = _number(block, 15, 20, np.int32)
+    for i in range(3):
+        atoms["pos"][:, i] = _number(block, 20+i*width, 20+(i+1)*width, np.float64)
+    if velocities:
+        for i in range(3):
+            atoms["vel"][:, i] = _number(block, 20+(3+i)*width, 20+(4+i)*width, np.float64)
+
+    return atoms, end
+
+
+def _read_line(buf, offset):
+    """Return the line starting at offset without newline and the position
+    of the next line."""
+    end = offset
+    while end < buf.size:
+        found = np.flatnonzero(buf[end:end+4096] == 10)
+        if found.size:
+            end += int(found[0])
+            return buf[offset:end].tobytes().rstrip(b"\r"), end+1
+        end += 4096
+    return buf[offset:].tobytes().rstrip(b"\r"), buf.size
+
+
+def read_gro(filename, velocities=None):
+    """
+    Read a Gromacs structure file into a NumPy structured array. The fixed
+    width columns of all atom lines are converted at once instead of line
+    by line.
+
+    Parameters
+    ----------
+    filename : string
+        link to the gro file
+    velocities : bool, optional
+        True to read velocities, False to skip them, default is to read them
+        if the file contains them
+
+    Returns
+    -------
+    title : string
+        title line of the file
+    atoms : ndarray
+        structured array with the fields resid, resname, atomname, atomid,
+        pos (x, y, z) and vel (only if velocities were read), residue and
+        atom names are stripped of whitespace
+    box : ndarray
+        box vector (3 or 9 values)
+    """
+    # Read complete file
+    with open(filename, "rb") as file_in:
+        buf = np.frombuffer(file_in.read(), dtype=np.uint8)
+
+    # Header
+    title, offset = _read_line(buf, 0)
+    num_atoms, offset = _read_line(buf, offset)
+    num_atoms = int(num_atoms)
+
+    # Atoms
+    atoms, offset = _parse_atoms(buf, offset, num_atoms, velocities=velocities)
+
+    # Box
+    box = np.array(_read_line(buf, offset)[0].split(), dtype=np.float64)
+
+    return title.decode(), atoms, box
+
+
+def read_gro_header(filename):
+    """
+    Read title, number of atoms and box of a Gromacs structure file without
+    parsing the atoms. The box is taken from the end of the file.
+
+    Parameters
+    ----------
+    filename : string
+        link to the gro file
+
+    Returns
+    -------
+    title : string
+        title line of the file
+    num_atoms : integer
+        number of atoms
+    box : ndarray
+        box vector (3 or 9 values)
+    """
+    with open(filename, "rb") as file_in:
+        title = file_in.readline().rstrip(b"\r\n")
+        num_atoms = int(file_in.readline())
+
+    return title.decode(), num_atoms, np.array(_box_line(filename).split(), dtype=np.float64)
+
+
+def _box_line(filename):
+    """Last non-empty line of a gro file without the line break."""
+    with open(filename, "rb") as file_in:
+        file_in.seek(0, os.SEEK_END)
+        file_in.seek(max(file_in.tell()-1024, 0))
+        return file_in.read().rstrip(b"\r\n \t").split(b"\n")[-1].rstrip(b"\r").decode()
+
+
+def iter_gro(filename, chunk_size=1000000, velocities=None):
+    """
+    Read the atoms of a Gromacs structure file in chunks. The file is read
+    block by block so that memory only depends on the chunk size. Chunks end
+    at residue boundaries, a residue is never split between two chunks.
+
+    Parameters
+    ----------
+    filename : string
+        link to the gro file
+    chunk_size : integer, optional
+        number of atom lines parsed at once
+    velocities : bool, optional
+        True to read velocities, False to skip them, default is to read them
+        if the file contains them
+
+    Yields
+    ------
+    atoms : ndarray
+        structured atom array of the chunk, see :func:`gro_dtype`
+    """
+    with open(filename, "rb") as file_in:
+        # Header
+        file_in.readline()
+        num_atoms = int(file_in.readline())
+        if not num_atoms:
+            return
+
+        # Line format from the first atom line
+        data = file_in.readline()
+        width = _field_width(data.rstrip())
+        if velocities is None:
+            velocities = len(data.rstrip()) >= 20+6*width
+        block_size = chunk_size*len(data)
+
+        carry = None
+        num_read = 0
+        while num_read < num_atoms:
+            # Complete lines of the next block
+            new_data = file_in.read(block_size)
+            data += new_data
+            buf = np.frombuffer(data, dtype=np.uint8)
+            num_lines = min(np.count_nonzero(buf == 10), num_atoms-num_read)
+            if not new_data and num_lines < num_atoms-num_read:
+                raise ValueError("Unexpected end of file after %i of %i atoms" % (num_read+num_lines, num_atoms))
+            atoms, end = _parse_atoms(buf, 0, num_lines, width, velocities)
+            data = data[end:]
+            num_read += num_lines
+
+            # Keep the last residue for the next chunk
+            if carry is not None:
+                atoms = np.concatenate((carry, atoms))
+            if num_read < num_atoms:
+                resid = atoms["resid"]
+                split = resid.size - np.argmax(resid[::-1] != resid[-1]) if np.any(resid != resid[-1]) else 0
+                carry = atoms[split:]
+                atoms = atoms[:split]
+
+            if atoms.size:
+                yield atoms
+
+
+def _cache_file(filename, cache, suffix):
+    """Cache file of a file, next to it if cache is True, otherwise in the
+    cache directory keyed by the absolute path of the file."""
+    if cache is True:
+        return filename + suffix
+    key = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:16]
+    return os.path.join(cache, os.path.basename(filename) + "." + key + suffix)
+
+
+def _file_stat(filename, *versions):
+    """Size and modification time of a file followed by format versions,
+    a cache entry is stale if they changed."""
+    stat = os.stat(filename)
+    return np.array([stat.st_size, stat.st_mtime_ns] + list(versions), dtype=np.int64)
+
+
+def _load_cache(link, stat):
+    """Arrays of a cache file, None if it is missing, unreadable or stale."""
+    try:
+        with np.load(link) as data:
+            if np.array_equal(data["stat"], stat):
+                return {key: data[key] for key in data.files}
+    except (OSError, KeyError, ValueError):
+        pass
+    return None
+
+
+def _save_cache(link, stat, arrays):
+    """Write arrays to a cache file atomically, failures are ignored."""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(link)), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(link)), suffix=".tmp", delete=False) as file_out:
+            np.savez(file_out, stat=stat, **arrays)
+        os.replace(file_out.name, link)
+    except OSError:
+        pass
+
+
+class GroTrajectory:
+    """
+    Random access to the frames of a multi-frame Gromacs structure file, as
+    written by ``gmx trjconv -o traj.gro``. The file is memory-mapped and
+    scanned once to build an index of the frame offsets. Frames are only
+    parsed when they are accessed.
+
+    The index can be cached next to the file as ``<filename>.idx.npz`` or
+    in a cache directory, it is rebuilt if size or modification time of the
+    file changed.
+
+    Parameters
+    ----------
+    filename : string
+        link to the gro file
+    cache : bool, string, optional
+        True to cache the frame index next to the file, link to a cache
+        directory or False to scan the file without writing anything
+    velocities : bool, optional
+        True to read velocities, False to skip them, default is to read them
+        if the file contains them
+
+    Examples
+    --------
+    .. code-block:: python
+
+        traj = gro_exp.gro.GroTrajectory("traj.gro", cache=True)
+        title, atoms, box = traj[-1]
+        for title, atoms, box in traj[100::10]:
+            pass
+    """
+    def __init__(self, filename, cache=False, velocities=None):
+        self._filename = filename
+        self._cache = cache
+        self._velocities = velocities
+
+        # Memory-map file
+        if os.path.getsize(filename):
+            self._buf = np.memmap(filename, dtype=np.uint8, mode="r").view(np.ndarray)
+        else:
+            self._buf = np.empty(0, dtype=np.uint8)
+
+        # Frame index
+        link = _cache_file(filename, cache, ".idx.npz") if cache else None
+        self._index = (_load_cache(link, _file_stat(filename)) or {}).get("index") if cache else None
+        if self._index is None:
+            self._index = self._scan()
+            if cache:
+                _save_cache(link, _file_stat(filename), {"index": self._index})
+        self._frames = np.arange(self._index.shape[0])
+
+    def _scan(self):
+        """
+        Scan the file for frames.
+
+        Returns
+        -------
+        index : ndarray
+            array with one row per frame containing the position of the title
+            line, the position of the first atom line and the number of atoms
+        """
+        buf = self._buf
+
+        # End of the last non-empty line
+        stop = buf.size
+        while stop and buf[stop-1] in b" \t\r\n":
+            stop -= 1
+
+        index = []
+        offset = 0
+        while offset < stop:
+            num_atoms, atoms_offset = _read_line(buf, _read_line(buf, offset)[1])
+            num_atoms = int(num_atoms)
+            index.append((offset, atoms_offset, num_atoms))
+            offset = _read_line(buf, _skip_lines(buf, atoms_offset, num_atoms))[1]
+        return np.array(index, dtype=np.int64).reshape(-1, 3)
+
+    def _frame(self, frame):
+        """Parse a frame."""
+        offset, atoms_offset, num_atoms = (int(value) for value in self._index[frame])
+        title = _read_line(self._buf, offset)[0]
+        atoms, offset = _parse_atoms(self._buf, atoms_offset, num_atoms, velocities=self._velocities)
+        box = np.array(_read_line(self._buf, offset)[0].split(), dtype=np.float64)
+        return title.decode(), atoms, box
+
+    def __len__(self):
+        return self._frames.size
+
+    def __getitem__(self, key):
+        """
+        Frame k as tuple of title, atom array and box vector, see
+        :func:`read_gro`, or a trajectory of the selected frames for slices
+        and lists of frames.
+        """
+        if isinstance(key, (int, np.integer)):
+            return self._frame(self._frames[key])
+        traj = object.__new__(GroTrajectory)
+        traj.__dict__.update(self.__dict__)
+        traj._frames = self._frames[key]
+        return traj
+
+    def __iter__(self):
+        for frame in self._frames:
+            yield self._frame(frame)
+
+    @property
+    def num_atoms(self):
+        """Number of atoms of each frame."""
+        return self._index[self._frames, 2]
+
+    def close(self):
+        """Release the memory-mapped file."""
+        self._buf = np.empty(0, dtype=np.uint8)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _format_int(values, width):
+    """Format non-negative integers right aligned as a byte matrix, same as
+    the %i format."""
+    out = np.full((values.size, width), 32, dtype=np.uint8)
+    rest = values.astype(np.int64)
+    for j in range(width-1, -1, -1):
+        out[:, j] = np.where((rest > 0) | (j == width-1), 48 + rest % 10, 32)
+        rest //= 10
+    return out
+
+
+def _format_float(values, width, prec):
+    """
+    Format floats as a byte matrix, same as the %width.precf format.
+
+    Parameters
+    ----------
+    values : ndarray
+        floats to format
+    width : integer
+        field width
+    prec : integer
+        number of decimals
+
+    Returns
+    -------
+    out : ndarray
+        uint8 matrix with one formatted number per row, None if a value does
+        not fit into the field width
+    """
+    if not np.all(np.isfinite(values)):
+        return None
+
+    # Round to integer, values close to a tie are rounded by Python
+    scaled = np.abs(values) * 10**prec
+    digits = np.rint(scaled)
+    tie = np.abs(np.abs(scaled-np.trunc(scaled))-0.5) < 1e-6
+    digits[tie] = [float(("%.*f" % (prec, value)).replace(".", "")) for value in np.abs(values[tie])]
+    digits = digits.astype(np.int64)
+
+    # Integer part length
+    whole = digits // 10**prec
+    num_whole = np.ones(values.size, dtype=np.int64)
+    for i in range(1, width):
+        num_whole += whole >= 10**i
+    sign = np.signbit(values)
+    if np.any(num_whole + sign + prec + 1 > width):
+        return None
+
+    # Digits, decimal point and sign
+    out = np.full((values.size, width), 32, dtype=np.uint8)
+    for j in range(width-1, width-prec-1, -1):
+        out[:, j] = 48 + digits % 10
+        digits //= 10
+    out[:, width-prec-1] = 46
+    for j in range(width-prec-2, -1, -1):
+        out[:, j] = np.where((digits > 0) | (j == width-prec-2), 48 + digits % 10, 32)
+        digits //= 10
+    rows = np.flatnonzero(sign)
+    out[rows, width-prec-2-num_whole[rows]] = 45
+
+    return out
+
+
+def _format_name(names, left):
+    """Format names as a byte matrix of width five, left or right aligned,
+    None if a name is not ASCII."""
+    codes = np.ascontiguousarray(names, dtype="U5").view(np.uint32).reshape(-1, 5)
+    if np.any(codes > 127):
+        return None
+    if not left:
+        shift = 5 - np.count_nonzero(codes, axis=1)
+        codes = np.take_along_axis(codes, (np.arange(5) - shift[:, None]) % 5, axis=1)
+    return np.where(codes == 0, 32, codes).astype(np.uint8)
+
+
+def _format_atoms(atoms, resid, atomid, velocities, suffix):
+    """
+    Format atom lines for a chunk of atoms. All columns are formatted as
+    byte matrices and concatenated, the string format is used as fallback
+    for values which do not fit into their fixed-width fields.
+
+    Parameters
+    ----------
+    atoms : ndarray
+        structured atom array
+    resid : ndarray
+        residue numbers to write
+    atomid : ndarray
+        atom numbers to write
+    velocities : bool
+        True to write the velocity block
+    suffix : string
+        string appended to each atom line
+
+    Returns
+    -------
+    text : bytes
+        formatted atom lines
+    """
+    # Columns as byte matrices
+    columns = [_format_int(resid, 5), _format_name(atoms["resname"], True),
+               _format_name(atoms["atomname"], False), _format_int(atomid, 5)]
+    columns += [_format_float(atoms["pos"][:, i], 8, 3) for i in range(3)]
+    if velocities:
+        columns += [_format_float(atoms["vel"][:, i], 8, 4) for i in range(3)]
+    end = (suffix+"\n").encode()
+    columns.append(np.tile(np.frombuffer(end, dtype=np.uint8), (atoms.size, 1)))
+    if not any(column is None for column in columns):
+        return np.hstack(columns).tobytes()
+
+    # String format
+    line = "%5i%-5s%5s%5i%8.3f%8.3f%8.3f"
+    if velocities:
+        line += "%8.4f%8.4f%8.4f"
+    line += suffix.replace("%", "%%") + "\n"
+    num_cols = 10 if velocities else 7
+    values = [None]*(num_cols*atoms.size)
+    values[0::num_cols] = resid.tolist()
+    values[1::num_cols] = atoms["resname"].tolist()
+    values[2::num_cols] = atoms["atomname"].tolist()
+    values[3::num_cols] = atomid.tolist()
+    for i in range(3):
+        values[4+i::num_cols] = atoms["pos"][:, i].tolist()
+        if velocities:
+            values[7+i::num_cols] = atoms["vel"][:, i].tolist()
+    return ((line*atoms.size) % tuple(values)).encode()
+
+
+def write_gro(filename, atoms, box, title="", velocities=None, renumber=True, suffix="", chunk_size=100000):
+    """
+    Write a Gromacs structure file. The atom lines are formatted column by
+    column for whole chunks of atoms and written in large blocks.
+
+    Atoms can also be given as an iterable of atom arrays, e.g. from
+    :func:`iter_gro`, to write files of any size with bounded memory. The
+    atom lines are then written to a temporary file and the number of atoms
+    in the header is set when all chunks are written.
+
+    Parameters
+    ----------
+    filename : string
+        link to the output gro file
+    atoms : ndarray or iterable
+        structured atom array, see :func:`gro_dtype`, or iterable of those
+    box : list, string
+        box vector (3 or 9 values) or box line which is written as is
+    title : string, optional
+        title line
+    velocities : bool, optional
+        True to write the velocity block, default is to write it if the atom
+        array contains velocities
+    renumber : bool, optional
+        True to number residues and atoms consecutively, False to write the
+        stored ids, numbers wrap around to 0 after 99999 in both cases
+    suffix : string, optional
+        string appended to each atom line
+    chunk_size : integer, optional
+        number of atoms formatted at once
+    """
+    # Chunks of atoms
+    if isinstance(atoms, np.ndarray):
+        num_atoms = atoms.size
+        chunks = (atoms[start:start+chunk_size] for start in range(0, atoms.size, chunk_size))
+    else:
+        num_atoms = None
+        chunks = atoms
+
+    # Atom lines to the output or to a temporary file next to it
+    if num_atoms is None:
+        file_atoms = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(filename)))
+    else:
+        file_atoms = open(filename, "wb")
+        file_atoms.write((title+"\n"+"%i" % num_atoms+"\n").encode())
+
+    with file_atoms:
+        # Atoms
+        last_resid = None
+        num_res = 0
+        num_a = 0
+        for chunk in chunks:
+            if not chunk.size:
+                continue
+
+            # Residue and atom numbers
+            if renumber:
+                new_res = np.ones(chunk.size, dtype=bool)
+                new_res[1:] = chunk["resid"][1:] != chunk["resid"][:-1]
+                new_res[0] = chunk["resid"][0] != last_resid
+                resid = (num_res + np.cumsum(new_res)) % 100000
+                atomid = (num_a + np.arange(1, chunk.size+1)) % 100000
+                last_resid = chunk["resid"][-1]
+                num_res += int(np.count_nonzero(new_res))
+            else:
+                resid = chunk["resid"] % 100000
+                atomid = chunk["atomid"] % 100000
+            num_a += chunk.size
+
+            vel = "vel" in chunk.dtype.names if velocities is None else velocities
+            file_atoms.write(_format_atoms(chunk, resid, atomid, vel, suffix))
+
+        # Box
+        box_line = ((box if isinstance(box, str) else "".join("%10.5f" % length for length in box))+"\n").encode()
+        if num_atoms is not None:
+            file_atoms.write(box_line)
+            return
+
+        # Header, atom lines and box
+        file_atoms.seek(0)
+        with open(filename, "wb") as file_out:
+            file_out.write((title+"\n"+"%i" % num_a+"\n").encode())
+            shutil.copyfileobj(file_atoms, file_out, 1 << 24)
+            file_out.write(box_line)
@@ -0,0 +1,504 @@
+import numpy as np
+
+from gro_exp.gro import _factorize
+
+
+# Atomic masses (g/mol) of the elements guessed from atom names
+MASSES = {"H": 1.008, "C": 12.011, "N": 14.007, "O": 15.999, "F": 18.998,
+          "P": 30.974, "S": 32.06, "I": 126.904, "K": 39.098,
+          "CL": 35.45, "BR": 79.904, "NA": 22.990, "MG": 24.305,
+          "LI": 6.94, "ZN": 65.38, "FE": 55.845, "SI": 28.085}
+
+# Atomic masses (g/mol) of common ion names which are no element symbols,
+# e.g. of the CHARMM force field
+ION_MASSES = {"SOD": 22.990, "POT": 39.098, "CLA": 35.45, "CAL": 40.078,
+              "LIT": 6.94, "RUB": 85.468, "CES": 132.905, "BAR": 137.327,
+              "ZN2": 65.38, "MG2": 24.305, "CA2": 40.078, "NA+": 22.990,
+              "K+": 39.098, "CL-": 35.45, "BR-": 79.904, "LI+": 6.94,
+              "CS+": 132.905, "RB+": 85.468, "MG2+": 24.305, "CA2+": 40.078,
+              "ZN2+": 65.38}
+
+
+def masses(atomnames, mass={}):
+    """
+    Atomic masses from the atom names. Common ion names like SOD, POT or
+    CLA are looked up in ``ION_MASSES``, otherwise the element is
+    guessed from the leading letters of the name. Two letter elements are
+    only considered for ions (e.g. CL, NA), so that CA is carbon.
+
+    Parameters
+    ----------
+    atomnames : ndarray
+        atom names, e.g. atoms["atomname"]
+    mass : dictionary, optional
+        masses by atom name which take precedence over the guess
+
+    Returns
+    -------
+    masses : ndarray
+        mass of each atom
+    """
+    names, inverse = _factorize(atomnames)
+    values = np.empty(names.size)
+    for j, name in enumerate(names.tolist()):
+        letters = name.lstrip("0123456789").upper()
+        if name in mass:
+            values[j] = mass[name]
+        elif name.upper() in ION_MASSES:
+            values[j] = ION_MASSES[name.upper()]
+        elif letters[:2] in MASSES and len(letters[:2]) == 2 and letters[:2] != "CA":
+            values[j] = MASSES[letters[:2]]
+        elif letters[:1] in MASSES:
+            values[j] = MASSES[letters[:1]]
+        else:
+            raise ValueError("Unknown element of atom name " + name + ", specify its mass")
+    return values[inverse]
+
+
+def residue_starts(atoms):
+    """
+    Index of the first atom of each residue. A new residue starts where the
+    residue number changes.
+
+    Parameters
+    ----------
+    atoms : ndarray
+        structured atom array, see :func:`gro_exp.gro.gro_dtype`
+
+    Returns
+    -------
+    starts : ndarray
+        first atom of each residue
+    """
+    resid = atoms["resid"]
+    if not resid.size:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate(([0], np.flatnonzero(resid[1:] != resid[:-1])+1))
+
+
+def residue_centers(atoms, box=None, mass={}, starts=None):
+    """
+    Centers of mass of all residues. Residues broken over periodic
+    boundaries are made whole around their first atom before averaging, the
+    centers are wrapped back into the box.
+
+    Parameters
+    ----------
+    atoms : ndarray
+        structured atom array, see :func:`gro_exp.gro.gro_dtype`
+    box : list, optional
+        box vector, only the rectangular box lengths are used
+    mass : dictionary, optional
+        masses by atom name, see :func:`masses`
+    starts : ndarray, optional
+        first atom of each residue, see :func:`residue_starts`
+
+    Returns
+    -------
+    centers : ndarray
+        center of mass of each residue
+    """
+    starts = residue_starts(atoms) if starts is None else starts
+    index = np.repeat(np.arange(starts.size), np.diff(np.append(starts, atoms.size)))
+
+    # Positions relative to the first atom of the residue
+    ref = atoms["pos"][starts]
+    pos = atoms["pos"] - ref[index]
+    if box is not None:
+        lengths = np.asarray(box, dtype=np.float64)[:3]
+        pos -= lengths * np.round(pos/lengths)
+
+    # Mass weighted mean
+    weights = masses(atoms["atomname"], mass)
+    total = np.bincount(index, weights, starts.size)
+    centers = ref + np.column_stack([np.bincount(index, pos[:, i]*weights, starts.size) for i in range(3)]) / total[:, None]
+    if box is not None:
+        centers %= lengths
+    return centers
+
+
+def _axis(axis):
+    """Axis index from x, y, z or an integer."""
+    return {"x": 0, "y": 1, "z": 2}[axis] if isinstance(axis, str) else int(axis)
+
+
+def _periodic(diff, box, axes):
+    """Apply the minimum image convention to distance vectors."""
+    if box is not None:
+        lengths = np.asarray(box, dtype=np.float64)[:3][axes]
+        diff -= lengths * np.round(diff/lengths)
+    return diff
+
+
+class Region:
+    """
+    Base class of geometric regions. Regions are evaluated on whole
+    coordinate arrays and can be combined with ``&`` (intersection), ``|``
+    (union) and ``~`` (complement).
+    """
+    def mask(self, pos, box=None):
+        """
+        Evaluate the region for all positions.
+
+        Parameters
+        ----------
+        pos : ndarray
+            positions with shape (n, 3)
+        box : list, optional
+            box vector for periodic distances of radial regions
+
+        Returns
+        -------
+        mask : ndarray
+            True for positions inside the region
+        """
+        raise NotImplementedError
+
+    def __and__(self, other):
+        return Intersection(self, other)
+
+    def __or__(self, other):
+        return Union(self, other)
+
+    def __invert__(self):
+        return Complement(self)
+
+
+class Slab(Region):
+    """
+    Open interval lo < pos < hi along one axis.
+
+    Parameters
+    ----------
+    axis : string
+        direction (x, y or z)
+    lo : float
+        lower bound
+    hi : float
+        upper bound
+    """
+    def __init__(self, axis, lo, hi):
+        self.axis = _axis(axis)
+        self.lo = lo
+        self.hi = hi
+
+    def mask(self, pos, box=None):
+        coord = pos[:, self.axis]
+        return (self.lo < coord) & (coord < self.hi)
+
+
+class Box(Region):
+    """
+    Open rectangular box lo < pos < hi in all three directions.
+
+    Parameters
+    ----------
+    lo : list
+        lower corner
+    hi : list
+        upper corner
+    """
+    def __init__(self, lo, hi):
+        self.lo = np.asarray(lo, dtype=np.float64)
+        self.hi = np.asarray(hi, dtype=np.float64)
+
+    def mask(self, pos, box=None):
+        return np.all((self.lo < pos) & (pos < self.hi), axis=1)
+
+
+class Sphere(Region):
+    """
+    Sphere with distance to the center smaller or equal to the radius.
+
+    Parameters
+    ----------
+    center : list
+        center of the sphere
+    radius : float
+        radius of the sphere
+    """
+    def __init__(self, center, radius):
+        self.center = np.asarray(center, dtype=np.float64)
+        self.radius = radius
+
+    def mask(self, pos, box=None):
+        diff = _periodic(pos - self.center, box, [0, 1, 2])
+        return np.einsum("ij,ij->i", diff, diff) <= self.radius**2
+
+
+class Cylinder(Region):
+    """
+    Cylinder along a box axis with radial distance to the axis smaller or
+    equal to the radius, optionally limited to lo < pos < hi along the axis.
+
+    Parameters
+    ----------
+    center : list
+        point on the cylinder axis
+    radius : float
+        radius of the cylinder
+    axis : string, optional
+        direction of the cylinder axis (x, y or z)
+    lo : float, optional
+        lower bound along the axis
+    hi : float, optional
+        upper bound along the axis
+    """
+    def __init__(self, center, radius, axis="z", lo=None, hi=None):
+        self.axis = _axis(axis)
+        self.radial = [i for i in range(3) if i != self.axis]
+        self.center = np.asarray(center, dtype=np.float64)[self.radial]
+        self.radius = radius
+        self.lo = lo
+        self.hi = hi
+
+    def mask(self, pos, box=None):
+        diff = _periodic(pos[:, self.radial] - self.center, box, self.radial)
+        mask = np.einsum("ij,ij->i", diff, diff) <= self.radius**2
+        if self.lo is not None:
+            mask &= pos[:, self.axis] > self.lo
+        if self.hi is not None:
+            mask &= pos[:, self.axis] < self.hi
+        return mask
+
+
+class Union(Region):
+    """Positions inside any of the regions."""
+    def __init__(self, *regions):
+        self.regions = regions
+
+    def mask(self, pos, box=None):
+        return np.logical_or.reduce([region.mask(pos, box) for region in self.regions])
+
+
+class Intersection(Region):
+    """Positions inside all of the regions."""
+    def __init__(self, *regions):
+        self.regions = regions
+
+    def mask(self, pos, box=None):
+        return np.logical_and.reduce([region.mask(pos, box) for region in self.regions])
+
+
+class Complement(Region):
+    """Positions outside of the region."""
+    def __init__(self, region):
+        self.region = region
+
+    def mask(self, pos, box=None):
+        return ~self.region.mask(pos, box)
+
+
+class CellList:
+    """
+    Cell list of positions for neighbor searches. The space is divided into
+    cells with an edge length of at least the cutoff and every indexed
+    position is registered in its own and all adjacent cells. The
+    candidates of a query point are then all positions registered in its
+    cell. With a box the search is periodic (rectangular boxes).
+
+    Parameters
+    ----------
+    pos : ndarray
+        indexed positions with shape (n, 3)
+    cutoff : float
+        largest search distance
+    box : list, optional
+        box vector for periodic boundaries
+
+    Examples
+    --------
+    .. code-block:: python
+
+        title, atoms, box = gro_exp.gro.read_gro("box.gro")
+        cells = gro_exp.select.CellList(atoms["pos"][atoms["resname"] == "BEN"], 0.3, box)
+        near = cells.within(atoms["pos"])
+    """
+    def __init__(self, pos, cutoff, box=None):
+        self.pos = np.ascontiguousarray(pos, dtype=np.float64).reshape(-1, 3)
+        self.cutoff = cutoff
+        self.periodic = box is not None
+
+        # Grid, without box with one empty cell layer around the positions
+        if self.periodic:
+            self.origin = np.zeros(3)
+            self.lengths = np.asarray(box, dtype=np.float64)[:3]
+        else:
+            lower = self.pos.min(axis=0) if self.pos.size else np.zeros(3)
+            upper = self.pos.max(axis=0) if self.pos.size else np.zeros(3)
+            self.origin = lower - cutoff
+            self.lengths = upper - lower + 2.5*cutoff
+        self.num_cells = np.maximum(np.floor(self.lengths/cutoff).astype(np.int64), 1)
+        while np.prod(self.num_cells) > 1 << 24:
+            self.num_cells = np.maximum(self.num_cells//2, 1)
+        self.cell_size = self.lengths / self.num_cells
+
+        # Offsets of the distinct adjacent cells
+        ranges = [range(-1, 2) if num >= 3 or not self.periodic else range(num) for num in self.num_cells]
+        offsets = np.array(np.meshgrid(*ranges, indexing="ij")).reshape(3, -1).T
+
+        # Register positions in the adjacent cells
+        cells = self._cells(self.pos)
+        adjacent = (cells[:, None, :] + offsets).reshape(-1, 3)
+        index = np.repeat(np.arange(self.pos.shape[0]), offsets.shape[0])
+        if self.periodic:
+            adjacent %= self.num_cells
+        else:
+            valid = np.all((adjacent >= 0) & (adjacent < self.num_cells), axis=1)
+            adjacent, index = adjacent[valid], index[valid]
+        adjacent = np.ravel_multi_index(adjacent.T, self.num_cells)
+        order = np.argsort(adjacent, kind="stable")
+        self.index = index[order]
+        self.cell_start = np.concatenate(([0], np.cumsum(np.bincount(adjacent, minlength=np.prod(self.num_cells)))))
+
+    def _cells(self, pos):
+        """Cell coordinates of positions."""
+        cells = np.floor((pos-self.origin)/self.cell_size).astype(np.int64)
+        if self.periodic:
+            cells %= self.num_cells
+        else:
+            np.clip(cells, 0, self.num_cells-1, out=cells)
+        return cells
+
+    def pairs(self, points, distance=None, chunk_size=1000000):
+        """
+        Pairs of points and indexed positions within a distance.
+
+        Parameters
+        ----------
+        points : ndarray
+            query positions with shape (m, 3)
+        distance : float, optional
+            search distance, at most the cutoff, default is the cutoff
+        chunk_size : integer, optional
+            number of points searched at once
+
+        Yields
+        ------
+        point : ndarray
+            index of the query point
+        index : ndarray
+            index of the indexed position
+        dist : ndarray
+            distance of the pair
+        """
+        distance = self.cutoff if distance is None else distance
+        points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+        for start in range(0, points.shape[0], chunk_size):
+            chunk = points[start:start+chunk_size]
+
+            # Candidates registered in the cell of each point
+            cell = np.ravel_multi_index(self._cells(chunk).T, self.num_cells)
+            first = self.cell_start[cell]
+            counts = self.cell_start[cell+1] - first
+            point = np.flatnonzero(counts)
+            first, counts = first[point], counts[point]
+            point = np.repeat(point, counts)
+            index = self.index[np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(point.size)]
+
+            # Distances
+            diff = chunk[point] - self.pos[index]
+            if self.periodic:
+                diff -= self.lengths * np.round(diff/self.lengths)
+            dist = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+            near = dist <= distance
+            yield point[near]+start, index[near], dist[near]
+
+    def within(self, points, distance=None):
+        """
+        Points with any indexed position within a distance.
+
+        Parameters
+        ----------
+        points : ndarray
+            query positions with shape (m, 3)
+        distance : float, optional
+            search distance, at most the cutoff, default is the cutoff
+
+        Returns
+        -------
+        mask : ndarray
+            True for points within the distance
+        """
+        mask = np.zeros(len(points), dtype=bool)
+        for point, index, dist in self.pairs(points, distance):
+            mask[point] = True
+        return mask
+
+
+class Within(Region):
+    """
+    Positions within a distance of reference positions, e.g. of a solute,
+    found with a :class:`CellList`. With a box the distances are periodic.
+
+    Parameters
+    ----------
+    points : ndarray
+        reference positions with shape (n, 3)
+    distance : float
+        distance from the reference positions
+
+    Examples
+    --------
+    Remove all water molecules with any atom within 0.3 nm of benzene:
+
+    .. code-block:: python
+
+        title, atoms, box = gro_exp.gro.read_gro("box.gro")
+        solute = atoms["pos"][atoms["resname"] == "BEN"]
+        gro_exp.utils.cut_gro("box.gro", "out.gro", mol={"SOL": gro_exp.select.Within(solute, 0.3)}, remove=True, mode="any")
+    """
+    def __init__(self, points, distance):
+        self.points = points
+        self.distance = distance
+        self._cells = {}
+
+    def mask(self, pos, box=None):
+        key = None if box is None else tuple(np.asarray(box)[:3])
+        if key not in self._cells:
+            self._cells[key] = CellList(self.points, self.distance, box)
+        return self._cells[key].within(pos)
+
+
+def select(atoms, region, mode="any", box=None, mass={}):
+    """
+    Select atoms in a region. Except for mode atom, whole residues are kept
+    or dropped by reducing the atom decisions of each residue.
+
+    Parameters
+    ----------
+    atoms : ndarray
+        structured atom array, see :func:`gro_exp.gro.gro_dtype`
+    region : Region
+        region to select
+    mode : string, optional
+        **atom** to select single atoms, **any** for residues with any atom
+        inside, **all** for residues with all atoms inside and **com** for
+        residues with the center of mass inside
+    box : list, optional
+        box vector for periodic distances and molecules
+    mass : dictionary, optional
+        masses by atom name for mode com, see :func:`masses`
+
+    Returns
+    -------
+    mask : ndarray
+        True for selected atoms
+    """
+    if mode == "atom":
+        return region.mask(np.ascontiguousarray(atoms["pos"]), box)
+    if not atoms.size:
+        return np.zeros(0, dtype=bool)
+
+    starts = residue_starts(atoms)
+    counts = np.diff(np.append(starts, atoms.size))
+    if mode == "any":
+        keep = np.logical_or.reduceat(region.mask(np.ascontiguousarray(atoms["pos"]), box), starts)
+    elif mode == "all":
+        keep = np.logical_and.reduceat(region.mask(np.ascontiguousarray(atoms["pos"]), box), starts)
+    elif mode == "com":
+        keep = region.mask(residue_centers(atoms, box, mass, starts), box)
+    else:
+        raise ValueError("Unknown mode " + str(mode))
+
+    return np.repeat(keep, counts)
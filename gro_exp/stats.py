@@ -0,0 +1,619 @@
+import numpy as np
+
+
+class RunningStats:
+    """
+    Online mean, variance, minimum and maximum of a series that is added
+    chunk by chunk. Chunks are combined with the parallel form of Welford's
+    algorithm, so the whole series never has to be held in memory.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        stats = RunningStats()
+        for data in iter_xvg("energy.xvg"):
+            stats.update(data[:, 1])
+        print(stats.mean, stats.std)
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = np.nan
+        self.min = np.nan
+        self.max = np.nan
+        self._m2 = 0
+
+    def update(self, values):
+        """
+        Add values to the statistics.
+
+        Parameters
+        ----------
+        values : ndarray
+            one dimensional array of values or 2D array with one column per
+            series
+        """
+        values = np.asarray(values, dtype=float)
+        count = values.shape[0]
+        if not count:
+            return
+
+        mean = np.mean(values, axis=0)
+        m2 = np.sum((values-mean)**2, axis=0)
+        if not self.count:
+            self.mean, self._m2 = mean, m2
+            self.min, self.max = np.min(values, axis=0), np.max(values, axis=0)
+        else:
+            total = self.count+count
+            delta = mean-self.mean
+            self.mean = self.mean+delta*count/total
+            self._m2 = self._m2+m2+delta**2*self.count*count/total
+            self.min = np.minimum(self.min, np.min(values, axis=0))
+            self.max = np.maximum(self.max, np.max(values, axis=0))
+        self.count += count
+
+    @property
+    def var(self):
+        """Sample variance."""
+        return self._m2/(self.count-1) if self.count > 1 else np.nan*self._m2
+
+    @property
+    def std(self):
+        """Sample standard deviation."""
+        return np.sqrt(self.var)
+
+
+class WindowMeans:
+    """
+    Online means over consecutive windows of a fixed number of values, e.g.
+    time averages of an energy series. Windows may span several chunks.
+
+    Parameters
+    ----------
+    window : integer
+        number of values per window
+    """
+    def __init__(self, window):
+        self.window = window
+        self._means = []
+        self._sum = 0
+        self._count = 0
+
+    def update(self, values):
+        """
+        Add values to the windows.
+
+        Parameters
+        ----------
+        values : ndarray
+            one dimensional array of values or 2D array with one column per
+            series
+        """
+        values = np.asarray(values, dtype=float)
+
+        # Fill the open window
+        fill = min(self.window-self._count, values.shape[0])
+        self._sum = self._sum+np.sum(values[:fill], axis=0)
+        self._count += fill
+        values = values[fill:]
+        if self._count < self.window:
+            return
+        self._means.append(self._sum/self.window)
+
+        # Complete windows at once
+        num = values.shape[0]//self.window
+        if num:
+            blocks = values[:num*self.window].reshape((num, self.window)+values.shape[1:])
+            self._means.extend(np.mean(blocks, axis=1))
+
+        # Open the next window
+        values = values[num*self.window:]
+        self._sum = np.sum(values, axis=0)
+        self._count = values.shape[0]
+
+    @property
+    def means(self):
+        """Means of all complete windows, an incomplete last window is
+        not included."""
+        return np.array(self._means)
+
+
+def linear_fit(x, y):
+    """
+    Least squares fit of a straight line.
+
+    Parameters
+    ----------
+    x : ndarray
+        x values
+    y : ndarray
+        y values
+
+    Returns
+    -------
+    slope : float
+        slope of the line
+    intercept : float
+        intercept of the line
+    slope_error : float
+        standard error of the slope
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    x_mean, y_mean = np.mean(x), np.mean(y)
+    sxx = np.sum((x-x_mean)**2)
+    sxy = np.sum((x-x_mean)*(y-y_mean))
+    slope = sxy/sxx
+    sse = np.sum((y-y_mean-slope*(x-x_mean))**2)
+    slope_error = np.sqrt(sse/(x.size-2)/sxx) if x.size > 2 else np.nan
+
+    return slope, y_mean-slope*x_mean, slope_error
+
+
+def _window_sums(values, width):
+    """Sums over all windows of a width from a cumulative sum."""
+    cumsum = np.concatenate(([0], np.cumsum(values)))
+    return cumsum[width:]-cumsum[:-width]
+
+
+def _window_fits(x, y, width, size=1, within=None):
+    """Slope, intercept and slope error of the least squares lines of all
+    windows of a width. The series is split into blocks of the width, each
+    block and the following one contain all windows starting in the block.
+    The values of these segments are centred and the least squares line of
+    the segment is removed from y before the window sums are taken from
+    cumulative sums, so the sums only lose precision relative to the
+    residuals in the window instead of the magnitude of the whole series.
+    Windows without spread in x or with a negative residual sum beyond
+    rounding are rejected with NaN values. For means of point blocks of a
+    size, the residual sums of squares and x spreads inside the point blocks
+    can be given as within, the slope error then approximates the one of
+    all points of the window."""
+    # Segments of two blocks
+    num = x.size-width+1
+    num_blocks = -(-num//width)
+    pad = (num_blocks+1)*width-x.size
+    seg_x = np.lib.stride_tricks.sliding_window_view(np.pad(x, (0, pad), mode="edge"), 2*width)[::width][:num_blocks]
+    seg_y = np.lib.stride_tricks.sliding_window_view(np.pad(y, (0, pad), mode="edge"), 2*width)[::width][:num_blocks]
+
+    # Centred values and residuals of the segment line
+    shift_x, shift_y = np.mean(seg_x, axis=1), np.mean(seg_y, axis=1)
+    seg_x, seg_y = seg_x-shift_x[:, None], seg_y-shift_y[:, None]
+    seg_xx = np.sum(seg_x*seg_x, axis=1)
+    seg_slope = np.divide(np.sum(seg_x*seg_y, axis=1), seg_xx, out=np.zeros(num_blocks), where=seg_xx > 0)
+    seg_y = seg_y-seg_slope[:, None]*seg_x
+
+    def sums(values):
+        cumsum = np.cumsum(values, axis=1, out=values)
+        window = cumsum[:, width-1:2*width-1].copy()
+        window[:, 1:] -= cumsum[:, :width-1]
+        return window.ravel()[:num]
+
+    sxx = sums(seg_x*seg_x)
+    sxy = sums(seg_x*seg_y)
+    syy = sums(seg_y*seg_y)
+    sum_x, sum_y = sums(seg_x), sums(seg_y)
+    sxx -= sum_x**2/width
+    sxy -= sum_x*sum_y/width
+    syy -= sum_y**2/width
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(sxx > 0, sxy/sxx, np.nan)
+        sse = syy-slope*sxy
+        sse = np.where(sse >= -1e-12*np.abs(syy), np.maximum(sse, 0), np.nan)
+        if within is None:
+            slope_error = np.sqrt(sse/(width-2)/sxx)
+        else:
+            slope_error = np.sqrt((size*sse+_window_sums(within[0], width))/(size*width-2)/(size*sxx+_window_sums(within[1], width)))
+
+    # Line of the original values
+    shift_x, shift_y = np.repeat(shift_x, width)[:num], np.repeat(shift_y, width)[:num]
+    offset = (sum_y-slope*sum_x)/width
+    slope = slope+np.repeat(seg_slope, width)[:num]
+
+    return slope, shift_y+offset-slope*shift_x, slope_error
+
+
+def linear_regime(x, y, min_points=10, num_widths=32, exponent=1, tol=0.1, max_points=100000):
+    """
+    Find the window of a series with the best linear regime, e.g. the
+    diffusive regime of a mean square displacement. All windows of a set of
+    geometrically spaced widths are fitted at once from blockwise cumulative
+    sums of centred and detrended values, one vectorized pass per width. A
+    window is admissible if the slope of its log-log fit deviates less than
+    a tolerance from the exponent (1 for normal diffusion), the admissible
+    window with the smallest relative slope error is returned. Series longer
+    than the maximal number of points are searched on the means of
+    consecutive blocks of points, the line is then fitted to all points of
+    the window.
+
+    Parameters
+    ----------
+    x : ndarray
+        x values in increasing order
+    y : ndarray
+        y values
+    min_points : integer, optional
+        minimal number of points in a window
+    num_widths : integer, optional
+        number of window widths between the minimal and full length
+    exponent : float, optional
+        expected log-log slope, None to accept all windows
+    tol : float, optional
+        tolerance of the log-log slope
+    max_points : integer, optional
+        maximal number of points searched, None to search all points
+
+    Returns
+    -------
+    start : integer
+        first index of the window
+    end : integer
+        index after the last point of the window
+    slope : float
+        slope of the least squares line
+    intercept : float
+        intercept of the least squares line
+    slope_error : float
+        standard error of the slope
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    min_points = max(min_points, 3)
+    if x.size < min_points:
+        raise ValueError("Series shorter than the minimal number of points")
+
+    # Block means of long series, windows with non positive values are not
+    # admissible for the log-log slope
+    valid = (x > 0) & (y > 0)
+    step = -(-x.size//max_points) if max_points else 1
+    within = None
+    if step > 1:
+        blocks = np.arange(0, x.size, step)
+        sizes = np.diff(np.append(blocks, x.size))
+        x_search, y_search = np.add.reduceat(x, blocks)/sizes, np.add.reduceat(y, blocks)/sizes
+        valid = np.logical_and.reduceat(valid, blocks)
+        min_points = max(-(-min_points//step), 3)
+
+        # Residuals of the lines inside the blocks for the slope errors
+        dx, dy = x-np.repeat(x_search, sizes), y-np.repeat(y_search, sizes)
+        wxx, wxy, wyy = np.add.reduceat(dx*dx, blocks), np.add.reduceat(dx*dy, blocks), np.add.reduceat(dy*dy, blocks)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            within = (np.where(wxx > 0, np.maximum(wyy-wxy**2/wxx, 0), wyy), wxx)
+    else:
+        x_search, y_search = x, y
+
+    # Center values for numerical accuracy
+    x_c, y_c = x_search-np.mean(x_search), y_search-np.mean(y_search)
+    log_x = np.log(np.where(valid, x_search, 1))
+    log_y = np.log(np.where(valid, y_search, 1))
+    log_x, log_y = log_x-np.mean(log_x), log_y-np.mean(log_y)
+
+    widths = np.unique(np.geomspace(min_points, x_search.size, num_widths).astype(int))
+    best = (np.inf, None)
+    for width in widths:
+        slope, intercept, slope_error = _window_fits(x_c, y_c, width, step, within)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rel_error = np.abs(slope_error/slope)
+        if exponent is not None:
+            log_slope = _window_fits(log_x, log_y, width)[0]
+            admissible = (_window_sums(~valid, width) == 0) & (np.abs(log_slope-exponent) < tol)
+            rel_error = np.where(admissible, rel_error, np.inf)
+        rel_error = np.where(np.isfinite(rel_error), rel_error, np.inf)
+
+        start = np.argmin(rel_error)
+        if rel_error[start] < best[0]:
+            best = (rel_error[start], start, start+width)
+
+    if best[1] is None:
+        raise ValueError("No linear regime found, increase the tolerance")
+
+    # Line of all points of the window
+    start, end = int(best[1])*step, min(int(best[2])*step, x.size)
+    slope, intercept, slope_error = linear_fit(x[start:end], y[start:end])
+    return start, end, float(slope), float(intercept), float(slope_error)
+
+
+def block_average(values, min_blocks=4, full_output=False):
+    """
+    Error of the mean of a correlated series by block averaging (Flyvbjerg
+    and Petersen). The means of all blocks of every block size (powers of
+    two) are taken from one cumulative sum. The error estimate increases
+    with the block size until the blocks are uncorrelated, the plateau is the
+    first block size whose next estimate increases less than its
+    uncertainty.
+
+    Parameters
+    ----------
+    values : ndarray
+        one dimensional series or 2D array with one column per series, e.g.
+        a data array of :func:`gro_exp.xvg.read_xvg`
+    min_blocks : integer, optional
+        minimal number of blocks of the largest block size
+    full_output : bool, optional
+        True to additionally return the error over the block size
+
+    Returns
+    -------
+    mean : float
+        mean of the series
+    error : float
+        standard error of the mean at the plateau
+    num_eff : float
+        effective number of uncorrelated samples
+    sizes : ndarray
+        block sizes, only with full output
+    errors : ndarray
+        standard error of the mean for each block size, only with full output
+    errors_error : ndarray
+        uncertainty of the errors, only with full output
+    """
+    values = np.asarray(values, dtype=float)
+    num = values.shape[0]
+    sizes = 2**np.arange(int(np.log2(max(num//min_blocks, 1)))+1)
+
+    # Block means of all block sizes
+    cumsum = np.concatenate((np.zeros((1,)+values.shape[1:]), np.cumsum(values, axis=0)))
+    errors = []
+    for size in sizes:
+        ends = cumsum[size::size]
+        means = (ends-cumsum[:ends.shape[0]*size:size])/size
+        errors.append(np.std(means, axis=0, ddof=1)/np.sqrt(means.shape[0]))
+    errors = np.array(errors)
+    num_blocks = (num//sizes).reshape((-1,)+(1,)*(values.ndim-1))
+    errors_error = errors/np.sqrt(2*(num_blocks-1))
+
+    # First block size without significant increase of the error
+    increase = np.diff(errors, axis=0) > errors_error[1:]
+    increase = np.concatenate((increase, np.zeros((1,)+increase.shape[1:], dtype=bool)))
+    plateau = np.argmin(increase, axis=0)
+    error = np.take_along_axis(errors, np.expand_dims(plateau, 0), axis=0)[0]
+
+    # Effective number of samples from the ratio to the naive error
+    num_eff = num*(errors[0]/error)**2
+
+    mean = np.mean(values, axis=0)
+    if full_output:
+        return mean, error, num_eff, sizes, errors, errors_error
+    return mean, error, num_eff
+
+
+def statistical_inefficiency(values):
+    """
+    Statistical inefficiency of a correlated series from the integrated
+    autocorrelation function, calculated with a fast Fourier transform. The
+    integration stops at the first non positive value of the
+    autocorrelation function.
+
+    Parameters
+    ----------
+    values : ndarray
+        one dimensional series or 2D array with one column per series
+
+    Returns
+    -------
+    inefficiency : float
+        statistical inefficiency, number of samples per uncorrelated sample,
+        1 for a constant series
+    """
+    values = np.asarray(values, dtype=float)
+    num = values.shape[0]
+
+    # Autocorrelation function of all columns
+    delta = values-np.mean(values, axis=0)
+    spectrum = np.fft.rfft(delta, n=2*num, axis=0)
+    acf = np.fft.irfft(spectrum*np.conj(spectrum), axis=0)[:num]
+    acf = acf/(num-np.arange(num)).reshape((-1,)+(1,)*(values.ndim-1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        acf = acf/acf[0]
+
+    # Integrate up to the first non positive value
+    lags = np.arange(1, num).reshape((-1,)+(1,)*(values.ndim-1))
+    positive = np.cumprod(acf[1:] > 0, axis=0)
+    inefficiency = 1+2*np.sum(positive*(1-lags/num)*acf[1:], axis=0)
+
+    # Constant series are uncorrelated
+    inefficiency = np.where(np.all(values == values[:1], axis=0), 1.0, np.maximum(inefficiency, 1))
+    return inefficiency[()]
+
+
+def bootstrap_linear_fit(x, y, num_samples=2000, confidence=0.95, block_size=1, seed=None, chunk_size=2**22):
+    """
+    Bootstrap confidence intervals of a least squares line. For correlated
+    series, blocks of consecutive points are resampled (moving block
+    bootstrap). The sums of all possible blocks are computed once, the
+    lines of the resamples are fitted from the number of times each block
+    is drawn, weighted with the block sums, for chunks of resamples at once.
+    Memory is bounded independent of the number of resamples.
+
+    Parameters
+    ----------
+    x : ndarray
+        x values
+    y : ndarray
+        y values
+    num_samples : integer, optional
+        number of resamples
+    confidence : float, optional
+        confidence level of the intervals
+    block_size : integer, optional
+        number of consecutive points resampled together
+    seed : integer, optional
+        seed of the random number generator
+    chunk_size : integer, optional
+        number of block counts processed at once
+
+    Returns
+    -------
+    slope : ndarray
+        mean, standard deviation and lower and upper bound of the confidence
+        interval of the slope
+    intercept : ndarray
+        mean, standard deviation and lower and upper bound of the confidence
+        interval of the intercept
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    num = x.size
+    block_size = int(min(max(block_size, 1), num))
+
+    # Sums of centred values of all blocks, the last block of a resample is
+    # cut to the remaining points
+    x_mean, y_mean = np.mean(x), np.mean(y)
+    x_c, y_c = x-x_mean, y-y_mean
+    values = (x_c, y_c, x_c*x_c, x_c*y_c)
+    rest = num-(num//block_size)*block_size
+    block_sums = np.stack([_window_sums(value, block_size) for value in values], axis=1)
+    rest_sums = np.stack([_window_sums(value, rest)[:block_sums.shape[0]] for value in values], axis=1) if rest else None
+
+    # Least squares lines of chunks of resamples from the counts of the drawn
+    # blocks, degenerate resamples are ignored
+    rng = np.random.default_rng(seed)
+    num_starts = block_sums.shape[0]
+    num_blocks = -(-num//block_size)
+    slopes = np.empty(num_samples)
+    intercepts = np.empty(num_samples)
+    step = max(chunk_size//max(num_blocks, num_starts), 1)
+    for begin in range(0, num_samples, step):
+        size = min(step, num_samples-begin)
+        starts = rng.integers(0, num_starts, (size, num_blocks))+num_starts*np.arange(size)[:, None]
+        if rest:
+            counts = np.bincount(starts[:, :-1].ravel(), minlength=size*num_starts).reshape(size, num_starts)
+            sums = counts @ block_sums + rest_sums[starts[:, -1]-num_starts*np.arange(size)]
+        else:
+            counts = np.bincount(starts.ravel(), minlength=size*num_starts).reshape(size, num_starts)
+            sums = counts @ block_sums
+        sum_x, sum_y, sum_xx, sum_xy = sums.T
+        sxx = sum_xx-sum_x**2/num
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where(sxx > 1e-10*np.sum(x_c**2), (sum_xy-sum_x*sum_y/num)/sxx, np.nan)
+        slopes[begin:begin+slope.size] = slope
+        intercepts[begin:begin+slope.size] = y_mean+sum_y/num-slope*(x_mean+sum_x/num)
+
+    # Statistics of the resampled parameters
+    bounds = [50*(1-confidence), 50*(1+confidence)]
+    return tuple(np.concatenate(([np.nanmean(values), np.nanstd(values, ddof=1)], np.nanpercentile(values, bounds))) for values in (slopes, intercepts))
+
+
+def linear_fit_batch(x, y):
+    """
+    Least squares lines of many series at once. Missing values (NaN) are
+    ignored, so series may have different numbers of points.
+
+    Parameters
+    ----------
+    x : ndarray
+        x values of all series (points) or of each series (series, points)
+    y : ndarray
+        y values of shape (series, points)
+
+    Returns
+    -------
+    slope : ndarray
+        slope of each series
+    intercept : ndarray
+        intercept of each series
+    slope_error : ndarray
+        standard error of the slopes
+    intercept_error : ndarray
+        standard error of the intercepts
+    residuals : ndarray
+        residuals of shape (series, points), NaN for missing values
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    valid = np.isfinite(x) & np.isfinite(y)
+    num = np.count_nonzero(valid, axis=1)
+
+    # Centered sums of all series
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = np.sum(np.where(valid, x, 0), axis=1)/num
+        y_mean = np.sum(np.where(valid, y, 0), axis=1)/num
+        x_c = np.where(valid, x-x_mean[:, None], 0)
+        y_c = np.where(valid, y-y_mean[:, None], 0)
+        sxx = np.sum(x_c**2, axis=1)
+        slope = np.sum(x_c*y_c, axis=1)/sxx
+        intercept = y_mean-slope*x_mean
+
+        # Standard errors from the residual variance
+        residuals = np.where(valid, y-intercept[:, None]-slope[:, None]*x, np.nan)
+        variance = np.nansum(residuals**2, axis=1)/(num-2)
+        slope_error = np.sqrt(variance/sxx)
+        intercept_error = np.sqrt(variance*(1/num+x_mean**2/sxx))
+
+    return slope, intercept, slope_error, intercept_error, residuals
+
+
+def _segment_argmax(values, starts):
+    """Index of the first maximum of each segment ignoring NaN, the first
+    index for segments of only NaN."""
+    values = np.where(np.isnan(values), -np.inf, values)
+    sizes = np.diff(np.append(starts, values.size))
+    hits = np.flatnonzero(values == np.repeat(np.maximum.reduceat(values, starts), sizes))
+    segments = np.searchsorted(starts, hits, side="right")-1
+    return hits[np.unique(segments, return_index=True)[1]]
+
+
+def downsample(x, y, num_points=5000, method="lttb"):
+    """
+    Shape preserving downsampling of a series for plotting. The series is
+    split into buckets of consecutive points and one point per bucket is
+    kept by the largest triangle three buckets (LTTB) method, or the minimum
+    and maximum of each bucket are kept. All buckets are processed at once,
+    LTTB uses the mean of the previous bucket as first triangle vertex
+    instead of the previously selected point. First and last points are
+    always kept. NaN values are ignored for the selection, a bucket of only
+    NaN values keeps its first point.
+
+    Parameters
+    ----------
+    x : ndarray
+        x values in increasing order
+    y : ndarray
+        y values
+    num_points : integer, optional
+        maximal number of points, at least 4 for **minmax**
+    method : string, optional
+        **lttb** or **minmax**
+
+    Returns
+    -------
+    x : ndarray
+        downsampled x values
+    y : ndarray
+        downsampled y values
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    num = x.size
+    if method == "minmax" and num_points < 4:
+        raise ValueError("Minmax downsampling needs at least 4 points")
+    if num <= num_points or num_points < 3:
+        return x, y
+
+    # Buckets between the first and last point
+    num_buckets = num_points-2 if method == "lttb" else (num_points-2)//2
+    starts = np.unique(np.linspace(1, num-1, num_buckets+1).astype(np.int64)[:-1])
+    sizes = np.diff(np.append(starts, num-1))
+
+    if method == "lttb":
+        # Triangle vertices before and after each bucket
+        valid = ~np.isnan(y[1:-1])
+        with np.errstate(invalid="ignore"):
+            x_mean = np.add.reduceat(x[1:-1], starts-1)/sizes
+            y_mean = np.add.reduceat(np.where(valid, y[1:-1], 0), starts-1)/np.add.reduceat(valid, starts-1)
+        x_prev, y_prev = np.append(x[0], x_mean[:-1]), np.append(y[0], y_mean[:-1])
+        x_next, y_next = np.append(x_mean[1:], x[-1]), np.append(y_mean[1:], y[-1])
+
+        # Point with the largest triangle in each bucket
+        bucket = np.repeat(np.arange(starts.size), sizes)
+        area = np.abs((x_prev[bucket]-x_next[bucket])*(y[1:-1]-y_prev[bucket])-(x_prev[bucket]-x[1:-1])*(y_next[bucket]-y_prev[bucket]))
+        index = _segment_argmax(area, starts-1)+1
+    elif method == "minmax":
+        index = np.concatenate((_segment_argmax(y[1:-1], starts-1), _segment_argmax(-y[1:-1], starts-1)))+1
+        index = np.unique(index)
+    else:
+        raise ValueError("Unknown downsampling method " + str(method))
+
+    index = np.concatenate(([0], index, [num-1]))
+    return x[index], y[index]
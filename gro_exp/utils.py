@@ -1,4 +1,6 @@
 import glob                        # use linux wildcard syntax
+import os
+import tempfile
 import numpy as np
 import sys
 import scipy.stats as stats
@@ -7,9 +9,76 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
-def cut_gro(filename, output, direction='z', area = [], mol={}, remove=False):
+from gro_exp.gro import _factorize, _box_line, gro_dtype, read_gro_header, iter_gro, write_gro
+from gro_exp.select import Region, Slab, select
+from gro_exp.xvg import read_xvg_header, iter_xvg, series, _columns
+from gro_exp.cache import read_gro, read_xvg
+from gro_exp.analysis import density_profile, gyration
+from gro_exp.stats import RunningStats, linear_fit, linear_regime, statistical_inefficiency, bootstrap_linear_fit, linear_fit_batch, downsample
+
+def _group_molecules(atoms):
+    """
+    Order atoms by residue name in order of the first appearance of the name
+    and number the molecules consecutively. A new molecule starts where the
+    residue number changes.
+
+    Parameters
+    ----------
+    atoms : ndarray
+        structured atom array from :func:`gro_exp.gro.read_gro`
+
+    Returns
+    -------
+    atoms : ndarray
+        reordered atom array with the consecutive molecule number starting at
+        1 as residue number
+    """
+    # Molecule index in the original order
+    new_mol = np.ones(atoms.size, dtype=bool)
+    new_mol[1:] = atoms["resid"][1:] != atoms["resid"][:-1]
+    mol_index = np.cumsum(new_mol)
+
+    # Stable sort by the first appearance of the residue name
+    order = np.argsort(_factorize(atoms["resname"])[1], kind="stable")
+    atoms = atoms[order]
+    mol_index = mol_index[order]
+
+    # Renumber molecules in the new order
+    new_mol[1:] = mol_index[1:] != mol_index[:-1]
+    atoms["resid"] = np.cumsum(new_mol)
+
+    return atoms
+
+
+def _cut_mask(atoms, direction, area, mol, remove, region, mode, box):
+    """Atoms of :func:`cut_gro` inside the area and outside the removal
+    areas of the specified molecules."""
+    if region is None and (area is None or not len(area)):
+        keep = np.ones(atoms.size, dtype=bool)
+    else:
+        region = Slab(direction, area[0], area[1]) if region is None else region
+        keep = select(atoms, region, mode, box)
+    if remove:
+        for mol_name, mol_area in mol.items():
+            mol_region = mol_area if isinstance(mol_area, Region) else Slab(direction, mol_area[0], mol_area[1])
+            keep &= ~((atoms["resname"] == mol_name.strip()) & select(atoms, mol_region, mode, box))
+    return keep
+
+
+def _spool_chunks(filename, chunk_size):
+    """Read atom arrays written with ndarray.tofile chunk by chunk."""
+    dtype = gro_dtype()
+    num_atoms = os.path.getsize(filename) // dtype.itemsize
+    for start in range(0, num_atoms, chunk_size):
+        yield np.fromfile(filename, dtype=dtype, count=min(chunk_size, num_atoms-start), offset=start*dtype.itemsize)
+
+
+def cut_gro(filename, output, direction='z', area = [], mol={}, remove=False, region=None, mode="atom", stream=False, chunk_size=1000000):
     """
     Function to cut into  Gromacs structure files or to remove molecules in specific areas.
+    Title and box line are copied from the input file, residues and atoms are
+    renumbered and the atom lines are written in the standard gro columns
+    (residue names left-aligned, atom names right-aligned).
 
     Parameters
     ----------
@@ -20,195 +89,97 @@ def cut_gro(filename, output, direction='z', area = [], mol={}, remove=False):
     direction : string
         direction (x,y or z)
     area : list
-        list [a,b] area which you want to have
+        list [a,b] area which you want to have, empty or None to keep all
+        atoms of the box
     mol : dictonary
-        key as the molecules name and value is a list c=[a,b]
+        key as the molecules name and value is a list c=[a,b] or a
+        :class:`gro_exp.select.Region`
         Remove the specified molecules in the area c
     remove: bool
         remove molecules specified in the mol dictonary
+    region : Region, optional
+        region which you want to have instead of the area, e.g.
+        :class:`gro_exp.select.Sphere` or a combination of regions
+    mode : string, optional
+        **atom** to cut single atoms, **any**, **all** or **com** to keep or
+        remove whole residues with any atom, all atoms or the center of mass
+        inside, see :func:`gro_exp.select.select`
+    stream : bool, optional
+        True to read the file in chunks with bounded memory, kept atoms are
+        collected in temporary files next to the output
+    chunk_size : integer, optional
+        number of atoms read at once in stream mode
     """
 
 
+    # Read, cut and write the structure in chunks
+    if stream:
+        title, num_atoms, box = read_gro_header(filename)
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output))) as temp_dir:
+            # Kept atoms with consecutive molecule number in one file per molecule name
+            spools = {}
+            last_resid = None
+            num_mol = 0
+            for atoms in iter_gro(filename, chunk_size, velocities=False):
+                atoms = atoms[_cut_mask(atoms, direction, area, mol, remove, region, mode, box)]
+                if not atoms.size:
+                    continue
+
+                new_mol = np.ones(atoms.size, dtype=bool)
+                new_mol[1:] = atoms["resid"][1:] != atoms["resid"][:-1]
+                new_mol[0] = atoms["resid"][0] != last_resid
+                last_resid = atoms["resid"][-1]
+                atoms["resid"] = num_mol + np.cumsum(new_mol)
+                num_mol = atoms["resid"][-1]
+
+                for mol_name in _factorize(atoms["resname"])[0]:
+                    if mol_name not in spools:
+                        spools[mol_name] = open(os.path.join(temp_dir, "%i.bin" % len(spools)), "wb")
+                    atoms[atoms["resname"] == mol_name].tofile(spools[mol_name])
+
+            for spool in spools.values():
+                spool.close()
+
+            # Create new gro file
+            chunks = (chunk for spool in spools.values() for chunk in _spool_chunks(spool.name, chunk_size))
+            write_gro(output, chunks, _box_line(filename), title)
+
+        return
+
     # Read filled structure
-    with open(filename, "r") as file_in:
-        counter = 0
-        data = []
-        for line in file_in:
-            if counter < 2:
-                if counter == 0:
-                    title = line
-                counter += 1
-            elif not len(line.split()) == 3:
-                atom = []
-                atom.append(int(line[0:5]))
-                atom.append(line[5:10])
-                atom.append(line[10:15])
-                atom.append(int(line[15:20]))
-                atom.append(float(line[20:28]))
-                atom.append(float(line[28:36]))
-                atom.append(float(line[36:44]))
-
-                data.append(atom)
-            else:
-                box = line
-
-    if direction == "x":
-        i = 4
-    elif direction == "y":
-        i = 5 
-    elif direction == "z":
-        i = 6
+    title, atoms, box = read_gro(filename, velocities=False)
 
-    # Create molecule lists
-    mols = {}
-    mol_names = []
-    last_atom = None
-    for atom in data:
-        if (atom[1] in mol) and remove:
-            if (mol[atom[1]][0]<atom[i]<mol[atom[1]][1]):
-                pass
-            elif (area[0]<atom[i]<area[1]):
-
-                # Create new dictionary entry
-                if not atom[1] in mols:
-                    mols[atom[1]] = []
-                    mol_names.append(atom[1])
-
-                # Create new molecule
-                if last_atom is None or not atom[0]==last_atom:
-                    mols[atom[1]].append([])
-
-                # Add atom
-                mols[atom[1]][-1].append(atom)
-                last_atom = atom[0]
-
-        elif (area[0]<atom[i]<area[1]):
-            # Create new dictionary entry
-            if not atom[1] in mols:
-                mols[atom[1]] = []
-                mol_names.append(atom[1])
-
-            # Create new molecule
-            if last_atom is None or not atom[0]==last_atom:
-                mols[atom[1]].append([])
-
-            # Add atom
-            mols[atom[1]][-1].append(atom)
-            last_atom = atom[0]
+    # Select atoms in the area
+    keep = _cut_mask(atoms, direction, area, mol, remove, region, mode, box)
 
+    # Create molecule lists
+    atoms = _group_molecules(atoms[keep])
 
     # Create new gro file
-    with open(output, "w") as file_out:
-        # Set title
-        file_out.write(title)
-
-        # Number of atoms
-        num_atoms = sum([sum([len(mol) for mol in mols[mol_name]]) for mol_name in mol_names])
-        file_out.write("%i" % num_atoms+"\n")
-
-        # Atoms
-        num_a = 0
-        num_m = 0
-        for mol_name in mol_names:
-            for mol in mols[mol_name]:
-                num_m = num_m+1 if num_m < 99999 else 0
-                for atom in mol:
-                    # Set ids
-                    num_a = num_a+1 if num_a < 99999 else 0
-
-                    # Write atom string
-                    out_string  = "%5i" % num_m  #  1- 5 (5)    Residue number
-                    out_string += atom[1]        #  6-10 (5)    Residue short name
-                    out_string += atom[2]        # 11-15 (5)    Atom name
-                    out_string += "%5i" % num_a  # 16-20 (5)    Atom number
-                    for j in range(3):           # 21-44 (3*8)  Coordinates
-                        out_string += "%8.3f" % atom[4+j]
-
-                    file_out.write(out_string+"\n")
-
-        # Box
-        file_out.write(box)
+    write_gro(output, atoms, _box_line(filename), title)
 
 def add_zeros_gro(filename, output):
     """
+    Function to append zero velocities to all atoms of a Gromacs structure file.
+    The box line is copied, the atom lines are written as in :func:`cut_gro`.
 
+    Parameters
+    ----------
+    filename : string
+        string to gro file
+    output : string
+        name of the output gro file
     """
 
 
     # Read filled structure
-    with open(filename, "r") as file_in:
-        counter = 0
-        data = []
-        for line in file_in:
-            if counter < 2:
-                if counter == 0:
-                    title = line
-                counter += 1
-            elif not len(line.split()) == 3:
-                atom = []
-                atom.append(int(line[0:5]))
-                atom.append(line[5:10])
-                atom.append(line[10:15])
-                atom.append(int(line[15:20]))
-                atom.append(float(line[20:28]))
-                atom.append(float(line[28:36]))
-                atom.append(float(line[36:44]))
-
-                data.append(atom)
-            else:
-                box = line
-
+    title, atoms, box = read_gro(filename, velocities=False)
 
     # Create molecule lists
-    mols = {}
-    mol_names = []
-    last_atom = None
-    for atom in data:
-        # Create new dictionary entry
-        if not atom[1] in mols:
-            mols[atom[1]] = []
-            mol_names.append(atom[1])
-
-        # Create new molecule
-        if last_atom is None or not atom[0]==last_atom:
-            mols[atom[1]].append([])
-
-        # Add atom
-        mols[atom[1]][-1].append(atom)
-        last_atom = atom[0]
+    atoms = _group_molecules(atoms)
 
     # Create new gro file
-    with open(output, "w") as file_out:
-        # Set title
-        file_out.write(title)
-
-        # Number of atoms
-        num_atoms = sum([sum([len(mol) for mol in mols[mol_name]]) for mol_name in mol_names])
-        file_out.write("%i" % num_atoms+"\n")
-
-        # Atoms
-        num_a = 0
-        num_m = 0
-        for mol_name in mol_names:
-            for mol in mols[mol_name]:
-                num_m = num_m+1 if num_m < 99999 else 0
-                for atom in mol:
-                    # Set ids
-                    num_a = num_a+1 if num_a < 99999 else 0
-
-                    # Write atom string
-                    out_string  = "%5i" % num_m  #  1- 5 (5)    Residue number
-                    out_string += atom[1]        #  6-10 (5)    Residue short name
-                    out_string += atom[2]        # 11-15 (5)    Atom name
-                    out_string += "%5i" % num_a  # 16-20 (5)    Atom number
-                    for j in range(3):           # 21-44 (3*8)  Coordinates
-                        out_string += "%8.3f" % atom[4+j]
-                    out_string += "\t 0 0 0"  # 16-20 (5)    Atom number
-
-                    file_out.write(out_string+"\n")
-
-        # Box
-        file_out.write(box)
+    write_gro(output, atoms, _box_line(filename), title, suffix="\t 0 0 0")
 
 
 
@@ -325,7 +296,14 @@ def bench_table(ns_day, cpus, ns, nodes=False, print_con=False):
     return data
 
 
-def msd(filename, is_print=False, is_plot=False, kwargs_line={}):
+def _lineplot(x, y, plot_points, kwargs_line):
+    """Line plot of a series downsampled to the maximal number of points."""
+    if plot_points is not None and len(x) > plot_points:
+        x, y = downsample(x, y, plot_points)
+    sns.lineplot(x=x, y=y, **kwargs_line)
+
+
+def msd(filename, is_print=False, is_plot=False, kwargs_line={}, plot_points=5000):
     """
     The function enables a display of the MSD history calculated by Gromacs by
     reading out a Gromacs xvg output file.
@@ -340,6 +318,10 @@ def msd(filename, is_print=False, is_plot=False, kwargs_line={}):
         True to plot the msd value over the time
     kwargs_line: dict, optional
         Dictionary with plotting parameters for the line plot
+    plot_points : integer, optional
+        maximal number of plotted points, longer series are downsampled with
+        :func:`gro_exp.stats.downsample` for the plot only, None to plot all
+        points
 
     Returns
     -------
@@ -357,84 +339,136 @@ def msd(filename, is_print=False, is_plot=False, kwargs_line={}):
     data_file = glob.glob(filename)
     time = []
     msd = []
+    if not data_file:
+        raise FileNotFoundError("No such file: " + str(filename))
 
-    # Open file
-    with open(filename, "r") as f:
-        for line in f:
-            if line.startswith("#"):
-                words = line.split()
+    # Read data
+    for i, file in enumerate(data_file):
+        data, meta = read_xvg(file)
+        time = data[:, 0]
+        msd = data[:, 1]
+
+    # Diffusion constant fitted by Gromacs
+    if not meta.diffusion:
+        raise ValueError("No diffusion constant (D[...] line) in " + str(filename))
+    msd_diff, msd_diff_std, unit = list(meta.diffusion.values())[-1]
 
     # Print MSD value
     if is_print:
         print("MSD Diffusion: "
-              + str(words[4]) + ' ' + str(words[5]) + str(words[6]) + "e-9 m s^-2")
-
-    # Read data
-    for i, file in enumerate(data_file):
-        time = np.genfromtxt(file, skip_header=20, usecols=0)
-        msd = np.genfromtxt(file, skip_header=20, usecols=1)
+              + str(msd_diff) + ' ' + "(+/-" + str(msd_diff_std) + ")e-9 m s^-2")
 
     # Plot msd
     if is_plot:
         plt.title("MSD")
-        sns.lineplot(x=time* 10**-3, y=msd, **kwargs_line)
+        _lineplot(time* 10**-3, msd, plot_points, kwargs_line)
         plt.xlabel("time (ns)")
         plt.ylabel("MSD")
 
     # Return data
-    return time, msd, str(words[4]), str(words[6][:-1])
+    return time, msd, str(msd_diff), str(msd_diff_std)
 
 
-def msd_fit(data_msd, area = [], is_plot = False, is_print = False, kwargs_line={}):
+def msd_fit(data_msd, area = [], is_plot = False, is_print = False, kwargs_line={}, full_output=False, kwargs_regime={}, bootstrap=0, confidence=0.95, seed=None, plot_points=5000):
     """
-    Function to fit the msd calculated with gromacs by hand. 
+    Function to fit the msd calculated with gromacs by hand. The diffusion
+    coefficient is the slope of a least squares line over the area using the
+    time column of the data.
 
     Parameters
     ----------
     data_msd : dictonary
         data dictonary from the function :func:`gro_exp.utils.msd`
-    area : list
-        area in which the msd will be calculated
+    area : list, string
+        area in ns in which the msd will be calculated or **auto** to detect
+        the diffusive regime with :func:`gro_exp.stats.linear_regime`
     is_print : bool, optional
         True to print msd diffusion coefficient
     is_plot : bool, optional
         True to plot the msd value over the time
     kwargs_line: dict, optional
         Dictionary with plotting parameters for the line plot
+    full_output : bool, optional
+        True to additionally return the error and the fitted area
+    kwargs_regime : dict, optional
+        Dictionary with parameters for :func:`gro_exp.stats.linear_regime`
+    bootstrap : integer, optional
+        number of resamples to calculate the error and confidence interval
+        with :func:`gro_exp.stats.bootstrap_linear_fit`, blocks of the
+        length of the statistical inefficiency of the residuals are
+        resampled, default analytic error
+    confidence : float, optional
+        confidence level of the interval
+    seed : integer, optional
+        seed of the random number generator for the bootstrap
+    plot_points : integer, optional
+        maximal number of plotted points, longer series are downsampled with
+        :func:`gro_exp.stats.downsample` for the plot only, None to plot all
+        points
 
     Returns
     -------
     msd_fit : float
         self fitted msd value (m^2/s)
+    msd_fit_error : float
+        standard error of the fitted msd value (m^2/s), only with full output
+    area : list
+        fitted area in ns, only with full output
+    interval : list
+        confidence interval of the fitted msd value (m^2/s), only with full
+        output
     """
 
     # Read dictonary
-    data = data_msd[1]          # read MSD
-    time = data_msd[0]          # read time (ps)
+    data = np.asarray(data_msd[1], dtype=float)     # read MSD (nm^2)
+    time = np.asarray(data_msd[0], dtype=float)     # read time (ps)
 
-    # Area for fitting
-    start = area[0] * 10 ** 3   # in ps
-    end = area[1] * 10 ** 3     # in ps
-    
-    # Fit msd value
-    msd_fit = (data[int(end/2)]-data[int(start/2)])*10**-18/(6*(time[int(end/2)]-time[int(start/2)])*10**-12)
+    # Fit msd value in the area
+    if isinstance(area, str) and area == "auto":
+        start, end, slope, intercept, slope_error = linear_regime(time, data, **kwargs_regime)
+        area = [time[start] * 10 ** -3, time[end-1] * 10 ** -3]
+    else:
+        mask = (time >= area[0] * 10 ** 3) & (time <= area[1] * 10 ** 3)
+        if not mask.any():
+            raise ValueError("No time in the area " + str(area) + " ns")
+        start, end = np.argmax(mask), mask.size-np.argmax(mask[::-1])
+        slope, intercept, slope_error = linear_fit(time[start:end], data[start:end])
+
+    # Confidence interval
+    if bootstrap:
+        residuals = data[start:end]-slope*time[start:end]-intercept
+        inefficiency = statistical_inefficiency(residuals)
+        block_size = int(np.ceil(inefficiency)) if np.isfinite(inefficiency) else 1
+        slope_boot = bootstrap_linear_fit(time[start:end], data[start:end], bootstrap, confidence, block_size, seed)[0]
+        slope_error = slope_boot[1]
+        interval = slope_boot[2:]
+    else:
+        interval = slope+np.array([-1, 1])*stats.t.ppf((1+confidence)/2, end-start-2)*slope_error
+
+    # Einstein relation, nm^2/ps to m^2/s
+    msd_fit = slope*10**-18/(6*10**-12)
+    msd_fit_error = slope_error*10**-18/(6*10**-12)
+    interval = list(interval*10**-18/(6*10**-12))
 
     # Plot msd curve from gromacs and shawod the considered area
     if is_plot:
         plt.title("MSD")
-        sns.lineplot(x=time* 10**-3, y=data, **kwargs_line)
+        _lineplot(time* 10**-3, data, plot_points, kwargs_line)
         plt.xlabel("time (ns)")
         plt.ylabel("MSD")
         plt.axvspan(xmin=area[0], xmax=area[1], facecolor="grey", alpha=0.3)
     
     # Print self fitted MSD Value
     if is_print:
-        print("MSD Diffusion (self): " + "%.4e" % (msd_fit) + " m^2/s")
+        print("MSD Diffusion (self): " + "%.4e" % (msd_fit) + " (+/-" + "%.4e" % (msd_fit_error) + ") m^2/s")
+        print("MSD Diffusion (self) %i%% interval: [" % (confidence*100) + "%.4e, %.4e" % tuple(interval) + "] m^2/s")
     
+    if full_output:
+        return msd_fit, msd_fit_error, area, interval
     return msd_fit
 
 
-def diff_inf_fit(diff_vec, x_vec, x="box", area = [], is_plot = False, is_print = False, kwargs_line={}, kwargs_scatter = {}):
+def diff_inf_fit(diff_vec, x_vec, x="box", area = [], is_plot = False, is_print = False, kwargs_line={}, kwargs_scatter = {}, bootstrap=0, confidence=0.95, seed=None, full_output=False):
     """
     Fuction to fit diffusion coefficient at an inifinite box size.
 
@@ -452,6 +486,15 @@ def diff_inf_fit(diff_vec, x_vec, x="box", area = [], is_plot = False, is_print
         True to plot the msd value over the time
     kwargs_line: dict, optional
         Dictionary with plotting parameters for the line plot
+    bootstrap : integer, optional
+        number of resamples to calculate the error with
+        :func:`gro_exp.stats.bootstrap_linear_fit`, default analytic error
+    confidence : float, optional
+        confidence level of the interval
+    seed : integer, optional
+        seed of the random number generator for the bootstrap
+    full_output : bool, optional
+        True to additionally return the confidence interval
 
     Returns
     -------
@@ -459,6 +502,9 @@ def diff_inf_fit(diff_vec, x_vec, x="box", area = [], is_plot = False, is_print
         diffusion coefficient for an inifinite box size
     error : float 
         error of intercept
+    interval : list
+        confidence interval of the intercept, from the bootstrap or the t
+        distribution, only with full output
     """
 
     
@@ -473,13 +519,18 @@ def diff_inf_fit(diff_vec, x_vec, x="box", area = [], is_plot = False, is_print
         if not area:
             area = [0, 1.05 * max(x_vec)]  
 
-    reg = stats.linregress(x_vec,diff_vec)
-    print(reg.slope)
-    print(len([(reg.slope*x + reg.intercept)  for x in np.arange(area[0], area[1] + 0.01, 0.01)]))
-    print(len(np.arange(area[0], area[1]+ 0.01, 0.01)))
+    slope, intercept, _, intercept_error, _ = [value[0] for value in linear_fit_batch(x_vec, diff_vec)]
+    if bootstrap:
+        intercept_boot = bootstrap_linear_fit(x_vec, diff_vec, bootstrap, confidence, seed=seed)[1]
+        intercept_error = intercept_boot[1]
+        interval = list(intercept_boot[2:])
+    else:
+        interval = list(intercept+np.array([-1, 1])*stats.t.ppf((1+confidence)/2, len(x_vec)-2)*intercept_error)
+
     # Plot msd curve from gromacs and shawod the considered area
     if is_plot:
-        sns.lineplot(x=[x for x in np.arange(area[0], area[1]+ 0.01, 0.01)], y= [(reg.slope*x + reg.intercept)  for x in np.arange(area[0], area[1] + 0.01, 0.01)],**kwargs_line)                   
+        x_line = np.arange(area[0], area[1]+0.01, 0.01)
+        sns.lineplot(x=x_line, y=slope*x_line+intercept, **kwargs_line)
         sns.scatterplot(x=x_vec,y=diff_vec, **kwargs_scatter)
         plt.xlabel("Inverse box (1/nm)")
         plt.ylabel("Diffusion (m^2/s)")
@@ -489,16 +540,127 @@ def diff_inf_fit(diff_vec, x_vec, x="box", area = [], is_plot = False, is_print
     
     # Print self fitted MSD Value
     if is_print:
-        print("Diffusion (inifinite box): " + "%.4e" % (reg.intercept) + " m^2/s")
-        print("Diffusion (inifinite box): " + "%.4e" % (reg.intercept_stderr) + " m^2/s")
+        print("Diffusion (inifinite box): " + "%.4e" % (intercept) + " m^2/s")
+        print("Diffusion (inifinite box): " + "%.4e" % (intercept_error) + " m^2/s")
+        print("Diffusion (infinite box) %i%% interval: [" % (confidence*100) + "%.4e, %.4e" % tuple(interval) + "] m^2/s")
     
-    return reg.intercept, reg.intercept_stderr
+    if full_output:
+        return intercept, intercept_error, interval
+    return intercept, intercept_error
+
+
+def diff_inf_batch(diff, x_vec, x="box", viscosity=None, temp=None):
+    """
+    Function to fit diffusion coefficients at an infinite box size for many
+    systems at once, e.g. all compounds and temperatures of a study. All
+    series are fitted with one vectorized least squares solution.
+    Optionally the slope is not fitted but given by the analytic correction
+    of Yeh and Hummer
+
+    .. math::
 
+        D_\\infty = D_\\text{PBC} + \\frac{\\xi k_BT}{6\\pi\\eta L}
 
-def density(filename, area = [], is_print=False, is_plot=False, kwargs_line={}):
+    with :math:`\\xi=2.837297` for cubic boxes.
+
+    Parameters
+    ----------
+    diff : ndarray
+        diffusion coefficients in m^2/s of shape (systems, box sizes), NaN
+        for missing values
+    x_vec : ndarray
+        box lengths in nm or number of molecules for all systems (box sizes)
+        or for each system (systems, box sizes)
+    x : string, optional
+        **box** for box lengths, **number** for numbers of molecules
+    viscosity : float, ndarray, optional
+        shear viscosity in Pa s of each system for the analytic correction,
+        requires box lengths
+    temp : float, ndarray, optional
+        temperature in K of each system for the analytic correction
+
+    Returns
+    -------
+    intercept : ndarray
+        diffusion coefficient for an infinite box size of each system
+    error : ndarray
+        standard error of the intercepts
+    residuals : ndarray
+        residuals of the fit of shape (systems, box sizes)
+    """
+    diff = np.atleast_2d(np.asarray(diff, dtype=float))
+    x_vec = np.asarray(x_vec, dtype=float)
+
+    # Inverse box length
+    if x == "box":
+        x_vec = 1/x_vec
+    elif x == "number":
+        x_vec = (1/x_vec)**(1/3)
+
+    # Fitted slope
+    if viscosity is None:
+        slope, intercept, slope_error, intercept_error, residuals = linear_fit_batch(x_vec, diff)
+        return intercept, intercept_error, residuals
+
+    # Slope of Yeh and Hummer, 1/L in 1/nm
+    if x != "box" or temp is None:
+        raise ValueError("The analytic correction requires box lengths and the temperature")
+    slope = -2.837297*1.380649e-23*np.asarray(temp, dtype=float)/(6*np.pi*np.asarray(viscosity, dtype=float))*1e9
+    corrected = diff-np.reshape(slope, (-1, 1))*np.broadcast_to(x_vec, diff.shape)
+    intercept = np.nanmean(corrected, axis=1)
+    num = np.count_nonzero(np.isfinite(corrected), axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        intercept_error = np.nanstd(corrected, axis=1, ddof=1)/np.sqrt(num)
+
+    return intercept, intercept_error, corrected-intercept[:, None]
+
+
+def _read_series(data, meta, names):
+    """Read the data sets of :func:`density` and :func:`gyrate`, a single
+    data set as one dimensional array."""
+    if names is None or isinstance(names, (str, int)) and not names == "all":
+        x, values, names = series(data, meta, [0 if names is None else names])
+        return x, values[:, 0], names
+    return series(data, meta, None if names == "all" else names)
+
+
+def _stream_means(filename, names, area, chunk_size):
+    """Mean and area mean of the data sets of :func:`density` and
+    :func:`gyrate` reading the file in chunks."""
+    meta = read_xvg_header(filename)
+    stats = RunningStats()
+    stats_area = RunningStats()
+    for data in iter_xvg(filename, chunk_size):
+        # Selected data sets
+        if names is None or isinstance(names, (str, int)) and not names == "all":
+            columns, legends = _columns(meta, data.shape[1]-1, [0 if names is None else names])
+            columns = columns[0]
+        else:
+            columns, legends = _columns(meta, data.shape[1]-1, None if names == "all" else names)
+
+        # Update statistics
+        stats.update(data[:, columns])
+        if area:
+            stats_area.update(data[(data[:, 0] > area[0]) & (data[:, 0] <= area[1]), columns])
+
+    return legends, stats.mean, stats_area.mean
+
+
+def _plot_series(x, values, names, kwargs_line, plot_points):
+    """Line plot of one or several data sets."""
+    if values.ndim == 1:
+        _lineplot(x, values, plot_points, kwargs_line)
+    else:
+        for j, name in enumerate(names):
+            _lineplot(x, values[:, j], plot_points, dict(kwargs_line, label=name))
+
+
+def density(filename, area = [], is_print=False, is_plot=False, kwargs_line={}, series=None, stream=False, chunk_size=1000000, kwargs_profile={}, plot_points=5000):
     """
     The function enables a calculation of the mean density in as simulation box
-    and can plot the density over the box. As input file a gromacs xvg has to use.
+    and can plot the density over the box. As input file a gromacs xvg has to use,
+    or a (multi-frame) gro file from which the profile is calculated with
+    :func:`gro_exp.analysis.density_profile`.
 
     Parameters
     ----------
@@ -512,15 +674,32 @@ def density(filename, area = [], is_print=False, is_plot=False, kwargs_line={}):
         True to plot the density over the box length
     kwargs_line: dict, optional
         Dictionary with plotting parameters for the line plot
+    series : string or list, optional
+        legend of the data set, list of legends or **all** to read several
+        data sets (e.g. groups) as columns of a 2D array, default is the
+        first data set
+    stream : bool, optional
+        True to read the file in chunks and calculate the means with online
+        statistics, the series is not held in memory and not plotted
+    chunk_size : integer, optional
+        number of rows read at once in stream mode
+    kwargs_profile : dict, optional
+        Dictionary with parameters for :func:`gro_exp.analysis.density_profile`
+        for gro files
+    plot_points : integer, optional
+        maximal number of plotted points, longer series are downsampled with
+        :func:`gro_exp.stats.downsample` for the plot only, None to plot all
+        points
 
     Returns
     -------
     length : list
-        list over box lengthden
+        list over box lengthden, empty in stream mode
     density : list
-        list with the density
+        list with the density, 2D array with one column per data set for
+        several data sets, empty in stream mode
     dens_mean : float
-        mean density in the simulation Box
+        mean density in the simulation Box, array for several data sets
     """
     # Read data and set list
     data_file = glob.glob(filename)
@@ -529,15 +708,22 @@ def density(filename, area = [], is_print=False, is_plot=False, kwargs_line={}):
 
     # Read data
     for i, file in enumerate(data_file):
-        length = np.genfromtxt(file, skip_header=24, usecols=0)
-        density = np.genfromtxt(file, skip_header=24, usecols=1)
+        if file.endswith(".gro"):
+            length, density, _ = density_profile(file, **kwargs_profile)
+            names = None
+        elif stream:
+            names, density_mean, density_area_mean = _stream_means(file, series, area, chunk_size)
+        else:
+            data, meta = read_xvg(file)
+            length, density, names = _read_series(data, meta, series)
 
     # Calculate density
-    density_mean = np.mean(density)
-    if area:
-        idx_1 = np.digitize(area[0],length)
-        idx_2 = np.digitize(area[1],length)
-        density_area_mean = np.mean(density[idx_1:idx_2])
+    if not stream or len(length):
+        density_mean = np.mean(density, axis=0)
+        if area:
+            idx_1 = np.digitize(area[0],length)
+            idx_2 = np.digitize(area[1],length)
+            density_area_mean = np.mean(density[idx_1:idx_2], axis=0)
         
     # Print density
     if is_print:            
@@ -546,7 +732,8 @@ def density(filename, area = [], is_print=False, is_plot=False, kwargs_line={}):
             print("Density ["+ str(area[0])+","+str(area[1])+"]: " + str(density_area_mean) + " kg m^-3")
     if is_plot:
         plt.title("Density")
-        sns.lineplot(x=length, y=density, **kwargs_line)
+        if not stream or len(length):
+            _plot_series(length, density, names, kwargs_line, plot_points)
         if area:
             plt.axvspan(xmin=area[0], xmax=area[1], facecolor="grey", alpha=0.3)
         plt.xlabel("Box length")
@@ -556,10 +743,12 @@ def density(filename, area = [], is_print=False, is_plot=False, kwargs_line={}):
     return length, density, density_mean
 
 
-def gyrate(filename, is_print=False, is_plot=False, kwargs_line={}):
+def gyrate(filename, is_print=False, is_plot=False, kwargs_line={}, series=None, stream=False, chunk_size=1000000, kwargs_gyration={}, plot_points=5000):
     """
     The function enables a calculation of the gyration radius for a molcule in a simulation box
-    and can plot the gyration over the box. As input file a gromacs xvg has to use.
+    and can plot the gyration over the box. As input file a gromacs xvg has to use,
+    or a (multi-frame) gro file for which the mean gyration radius of the
+    molecules in each frame is calculated with :func:`gro_exp.analysis.gyration`.
 
     Parameters
     ----------
@@ -571,15 +760,33 @@ def gyrate(filename, is_print=False, is_plot=False, kwargs_line={}):
         True to plot the density over the box length
     kwargs_line: dict, optional
         Dictionary with plotting parameters for the line plot
+    series : string or list, optional
+        legend of the data set, list of legends or **all** to read several
+        data sets (e.g. Rg and its components) as columns of a 2D array,
+        default is the first data set
+    stream : bool, optional
+        True to read the file in chunks and calculate the mean with online
+        statistics, the series is not held in memory and not plotted
+    chunk_size : integer, optional
+        number of rows read at once in stream mode
+    kwargs_gyration : dict, optional
+        Dictionary with parameters for :func:`gro_exp.analysis.gyration` for
+        gro files
+    plot_points : integer, optional
+        maximal number of plotted points, longer series are downsampled with
+        :func:`gro_exp.stats.downsample` for the plot only, None to plot all
+        points
 
     Returns
     -------
     length : list
-        list over box length
+        list over box length, empty in stream mode
     gyrate : list
-        list with the gyration radius
+        list with the gyration radius, 2D array with one column per data
+        set for several data sets, empty in stream mode
     gyrate : float
-        mean gyration radius in the simulation Box
+        mean gyration radius in the simulation Box, array for several data
+        sets
     """
     # Read data and set list
     data_file = glob.glob(filename)
@@ -588,11 +795,18 @@ def gyrate(filename, is_print=False, is_plot=False, kwargs_line={}):
 
     # Read data
     for i, file in enumerate(data_file):
-        length = np.genfromtxt(file, skip_header=28, usecols=0)
-        gyrate = np.genfromtxt(file, skip_header=28, usecols=1)
+        if file.endswith(".gro"):
+            length, _, gyrate = gyration(file, **kwargs_gyration)
+            names = None
+        elif stream:
+            names, gyrate_mean, _ = _stream_means(file, series, [], chunk_size)
+        else:
+            data, meta = read_xvg(file)
+            length, gyrate, names = _read_series(data, meta, series)
 
     # Calculate gyrate
-    gyrate_mean = np.mean(gyrate)
+    if not stream or len(length):
+        gyrate_mean = np.mean(gyrate, axis=0)
 
     # Print gyrate
     if is_print:
@@ -600,7 +814,8 @@ def gyrate(filename, is_print=False, is_plot=False, kwargs_line={}):
 
     if is_plot:
         plt.title("gyrate")
-        sns.lineplot(x=length, y=gyrate, **kwargs_line)
+        if not stream or len(length):
+            _plot_series(length, gyrate, names, kwargs_line, plot_points)
         plt.xlabel("Box length")
         plt.ylabel("gyrate")
 
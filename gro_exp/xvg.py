@@ -0,0 +1,353 @@
+import concurrent.futures
+import glob
+import re
+import warnings
+import numpy as np
+
+
+def _plain(label):
+    """Remove Grace formatting codes (e.g. \\S, \\N) from a label."""
+    return re.sub(r"\\[A-Za-z0-9+-]", "", label).strip()
+
+
+class XvgMeta:
+    """
+    Header information of a Gromacs xvg file.
+
+    Attributes
+    ----------
+    title : string
+        plot title
+    xlabel : string
+        label of the x axis
+    ylabel : string
+        label of the y axis
+    legends : list
+        legend of each data set (s0, s1, ...)
+    directives : list
+        all lines starting with @ without the @
+    comments : list
+        all lines starting with # without the #
+    diffusion : dictionary
+        diffusion constants of the comment lines ``D[ group] = value (+/-
+        error) (unit)`` as group name to tuple of value, error and unit
+    """
+    def __init__(self):
+        self.title = ""
+        self.xlabel = ""
+        self.ylabel = ""
+        self.legends = []
+        self.directives = []
+        self.comments = []
+        self.diffusion = {}
+
+    def column(self, name):
+        """
+        Column of a data set in the data array.
+
+        Parameters
+        ----------
+        name : string or integer
+            legend of the data set, Grace formatting codes like ``\\S`` and
+            ``\\N`` can be omitted, or number of the data set (0 for s0)
+
+        Returns
+        -------
+        column : integer
+            column index in the data array
+        """
+        if isinstance(name, (int, np.integer)):
+            return int(name)+1
+        if name in self.legends:
+            return self.legends.index(name)+1
+        plain = [_plain(legend) for legend in self.legends]
+        if _plain(name) in plain:
+            return plain.index(_plain(name))+1
+        raise KeyError("No data set with legend " + str(name))
+
+    def _add(self, line):
+        """Add a header line."""
+        if line.startswith("#"):
+            line = line[1:].strip()
+            self.comments.append(line)
+            match = re.match(r"D\[\s*(.*?)\s*\]\s*=\s*(\S+)\s*\(\+/-\s*(\S+)\)\s*\((.*)\)", line)
+            if match:
+                self.diffusion[match.group(1)] = (float(match.group(2)), float(match.group(3)), match.group(4))
+            return
+
+        line = line[1:].strip()
+        self.directives.append(line)
+        match = re.match(r'(title|xaxis\s+label|yaxis\s+label|s(\d+)\s+legend)\s+"(.*)"', line)
+        if not match:
+            return
+        if match.group(1) == "title":
+            self.title = match.group(3)
+        elif match.group(1).startswith("xaxis"):
+            self.xlabel = match.group(3)
+        elif match.group(1).startswith("yaxis"):
+            self.ylabel = match.group(3)
+        else:
+            num = int(match.group(2))
+            self.legends += [""]*(num+1-len(self.legends))
+            self.legends[num] = match.group(3)
+
+
+def _tokens_per_line(text):
+    """Number of whitespace separated values of each non-empty line."""
+    chars = np.frombuffer(text.encode(), dtype=np.uint8)
+    space = chars <= 32
+    starts = ~space
+    starts[1:] &= space[:-1]
+    ends = np.append(np.flatnonzero(chars == 10), chars.size)
+    counts = np.diff(np.searchsorted(np.flatnonzero(starts), ends), prepend=0)
+    return counts[counts > 0]
+
+
+def _parse(text, meta):
+    """Parse data lines, header lines and set separators in between are
+    added to the metadata or skipped. Non-numeric values and lines with a
+    different number of columns raise a ValueError."""
+    if any(mark in text for mark in ("\n#", "\n@", "\n&")) or text.startswith(("#", "@", "&")):
+        lines = []
+        for line in text.splitlines():
+            if line.startswith(("#", "@")):
+                meta._add(line)
+            elif not line.startswith("&"):
+                lines.append(line)
+        text = "\n".join(lines)
+
+    body = text.strip()
+    num_cols = len(body.split("\n", 1)[0].split())
+
+    # Parsing stops at the first non-numeric value with a warning only
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            data = np.fromstring(body, sep=" ") if num_cols else np.empty(0)
+        except (DeprecationWarning, ValueError):
+            raise ValueError("Non-numeric value")
+    tokens = _tokens_per_line(body)
+    if np.any(tokens != num_cols):
+        raise ValueError("Inconsistent number of columns")
+    if data.size != np.sum(tokens):
+        raise ValueError("Non-numeric value")
+
+    return data.reshape(-1, max(num_cols, 1))
+
+
+def read_xvg(filename):
+    """
+    Read a Gromacs xvg file in a single pass. Header lines (@ directives
+    and # comments) are collected into a metadata object, all numeric
+    columns are parsed at once into one array.
+
+    Parameters
+    ----------
+    filename : string
+        link to the xvg file
+
+    Returns
+    -------
+    data : ndarray
+        array with one row per data line and one column per value
+    meta : XvgMeta
+        header information
+    """
+    # Read complete file
+    with open(filename, "r") as file_in:
+        text = file_in.read()
+
+    # Header at the beginning of the file
+    meta = XvgMeta()
+    pos = 0
+    while pos < len(text) and text[pos] in "#@\n":
+        end = text.find("\n", pos)
+        end = len(text) if end < 0 else end
+        if end > pos:
+            meta._add(text[pos:end])
+        pos = end+1
+
+    # Numeric data
+    try:
+        data = _parse(text[pos:], meta)
+    except ValueError as e:
+        raise ValueError(str(e) + " in " + filename)
+
+    return data, meta
+
+
+def read_xvg_header(filename):
+    """
+    Read the header lines at the beginning of a Gromacs xvg file without
+    reading the data.
+
+    Parameters
+    ----------
+    filename : string
+        link to the xvg file
+
+    Returns
+    -------
+    meta : XvgMeta
+        header information
+    """
+    meta = XvgMeta()
+    with open(filename, "r") as file_in:
+        for line in file_in:
+            if line[:1] not in ("#", "@", "\n"):
+                break
+            if line.strip():
+                meta._add(line.rstrip("\n"))
+
+    return meta
+
+
+def iter_xvg(filename, chunk_size=1000000, block_size=2**24):
+    """
+    Read the data of a Gromacs xvg file in chunks with bounded memory.
+    Header lines and data set separators are skipped, use
+    :func:`read_xvg_header` for the metadata.
+
+    Parameters
+    ----------
+    filename : string
+        link to the xvg file
+    chunk_size : integer, optional
+        number of rows per chunk, the last chunk may be shorter
+    block_size : integer, optional
+        number of bytes read from the file at once
+
+    Yields
+    ------
+    data : ndarray
+        array with chunk_size rows and one column per value
+    """
+    meta = XvgMeta()
+    buffer = []
+    num_rows = 0
+    rest = b""
+    with open(filename, "rb") as file_in:
+        while True:
+            # Read complete lines
+            block = file_in.read(block_size)
+            text = rest + block
+            end = text.rfind(b"\n")+1 if block else len(text)
+            text, rest = text[:end], text[end:]
+
+            # Parse and collect rows
+            if text.strip():
+                try:
+                    data = _parse(text.decode(), meta)
+                except ValueError as e:
+                    raise ValueError(str(e) + " in " + filename)
+                if data.size:
+                    if buffer and data.shape[1] != buffer[0].shape[1]:
+                        raise ValueError("Inconsistent number of columns in " + filename)
+                    buffer.append(data)
+                    num_rows += data.shape[0]
+
+            # Yield full chunks
+            while num_rows >= chunk_size or (not block and num_rows):
+                data = np.concatenate(buffer) if len(buffer) > 1 else buffer[0]
+                yield data[:chunk_size]
+                buffer = [data[chunk_size:]]
+                num_rows = buffer[0].shape[0]
+
+            if not block:
+                break
+
+
+def _columns(meta, num_sets, names):
+    """Columns and legends of the data sets selected by legend or number."""
+    # Data sets without legend are named by their number
+    legends = meta.legends + [""]*(num_sets-len(meta.legends))
+    legends = [legend if legend else "s%i" % i for i, legend in enumerate(legends)]
+
+    columns = list(range(1, num_sets+1))
+    if names is not None:
+        columns = [legends.index(name)+1 if name in legends else meta.column(name) for name in names]
+    if any(column > num_sets for column in columns):
+        raise KeyError("Data set not in " + str(legends))
+
+    return columns, [legends[column-1] for column in columns]
+
+
+def series(data, meta, names=None):
+    """
+    Select data sets of an xvg file by legend.
+
+    Parameters
+    ----------
+    data : ndarray
+        data array from :func:`read_xvg`
+    meta : XvgMeta
+        header information from :func:`read_xvg`
+    names : list, optional
+        legends or numbers of the data sets, default all data sets
+
+    Returns
+    -------
+    x : ndarray
+        first column (time or coordinate)
+    values : ndarray
+        contiguous array with one column per selected data set
+    names : list
+        legend of each selected data set
+    """
+    columns, names = _columns(meta, data.shape[1]-1, names)
+
+    return data[:, 0], np.ascontiguousarray(data[:, columns]), names
+
+
+def _read_data(filename):
+    """Data array of an xvg file for the batch reader."""
+    return read_xvg(filename)[0]
+
+
+def read_xvg_batch(filenames, workers=None, processes=False, stack=True):
+    """
+    Read many xvg files, e.g. replicas of a simulation, concurrently and
+    calculate the ensemble mean and spread.
+
+    Parameters
+    ----------
+    filenames : string or list
+        glob pattern or list of links to xvg files
+    workers : integer, optional
+        number of threads or processes, default chosen by the executor
+    processes : bool, optional
+        True to parse in a process pool instead of a thread pool
+    stack : bool, optional
+        True to return one stacked array, False for a dictionary
+
+    Returns
+    -------
+    data : ndarray, dictionary
+        array of shape (files, rows, columns) in the sorted order of the
+        files or dictionary of file link to data array
+    mean : ndarray
+        mean over the files, rows beyond the shortest file are ignored
+    std : ndarray
+        standard deviation over the files with the same shape as the mean
+    """
+    if isinstance(filenames, str):
+        filenames = sorted(glob.glob(filenames))
+    if not filenames:
+        raise ValueError("No xvg files to read")
+
+    # Parse concurrently
+    executor = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+    with executor(workers) as pool:
+        arrays = list(pool.map(_read_data, filenames))
+
+    # Ensemble over the common rows
+    if any(array.shape[1:] != arrays[0].shape[1:] for array in arrays):
+        raise ValueError("Inconsistent number of columns in the xvg files")
+    num_rows = min(array.shape[0] for array in arrays)
+    if stack and any(array.shape[0] != num_rows for array in arrays):
+        raise ValueError("Inconsistent number of rows in the xvg files, use stack=False")
+    stacked = np.stack([array[:num_rows] for array in arrays])
+    mean = np.mean(stacked, axis=0)
+    std = np.std(stacked, axis=0, ddof=1) if len(arrays) > 1 else np.zeros_like(mean)
+
+    return stacked if stack else dict(zip(filenames, arrays)), mean, std
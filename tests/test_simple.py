@@ -6,6 +6,7 @@ import shutil
 import unittest
 
 import numpy as np
+import scipy.stats
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
@@ -39,7 +40,184 @@ class UserModelCase(unittest.TestCase):
     # Test cut function
     def test_cut(self): 
         gro_exp.utils.cut_gro("data/test.gro","output/test.gro", direction="z", area= [15,18])
+
+        # Box line is copied, atom lines are written in the standard columns
+        with open("data/test.gro", "r") as file_in:
+            lines = file_in.read().splitlines()
+        with open("output/box.gro", "w") as file_out:
+            file_out.write("\n".join(lines[:2] + [line[:5] + "BEN  C1   " + line[15:] if line[5:8] == "BEN" else line for line in lines[2:-1]] + ["   3.0 3.0   20.0"]) + "\n")
+        gro_exp.utils.cut_gro("output/box.gro", "output/box_cut.gro", area=[0, 20])
+        with open("output/box_cut.gro", "r") as file_in:
+            lines = file_in.read().splitlines()
+        self.assertEqual(lines[-1], "   3.0 3.0   20.0")
+        self.assertEqual(lines[2][5:15], "BEN     C1")
+
+        # Stream mode
+        gro_exp.utils.cut_gro("data/test.gro","output/cut.gro", direction="z", area= [5,15], mol={"SOL": [9,12]}, remove=True)
+        gro_exp.utils.cut_gro("data/test.gro","output/cut_stream.gro", direction="z", area= [5,15], mol={"SOL": [9,12]}, remove=True, stream=True, chunk_size=10)
+        with open("output/cut.gro", "r") as file_a, open("output/cut_stream.gro", "r") as file_b:
+            self.assertEqual(file_a.read(), file_b.read())
+        self.assertEqual([atoms.size for atoms in gro_exp.gro.iter_gro("data/test.gro", chunk_size=10)][:3], [6, 12, 12])
+
+    # Test geometric selections
+    def test_select(self):
+        title, atoms, box = gro_exp.gro.read_gro("data/test.gro")
+        select = gro_exp.select
+        starts = select.residue_starts(atoms)
+        self.assertEqual(starts.size, 184)
+
+        # Whole residues
+        region = select.Slab("z", 9, 11) | select.Sphere([1.5, 1.5, 1], 1)
+        for mode in ["any", "all", "com"]:
+            mask = select.select(atoms, region, mode, box)
+            self.assertTrue(all(mask[start] == mask[start:end].all() for start, end in zip(starts, np.append(starts[1:], atoms.size))))
+        any_mask = select.select(atoms, region, "any", box)
+        all_mask = select.select(atoms, region, "all", box)
+        self.assertTrue(np.all(any_mask >= all_mask))
+        self.assertTrue(np.all(select.select(atoms, ~region, "atom") != select.select(atoms, region, "atom")))
+        self.assertEqual(select.select(atoms, select.Box([0, 0, 0], [3, 3, 20]) & select.Cylinder([1.5, 1.5, 0], 10), "all").sum(), 624)
+
+        # Periodic center of mass
+        atoms["pos"][:2] = [[0.05, 1, 1], [2.95, 1, 1]]
+        atoms["atomname"][:2] = "OW"
+        atoms["pos"][2:6] = [[2.9, 1, 1]]*4
+        centers = select.residue_centers(atoms[:6], box)
+        self.assertAlmostEqual(centers[0, 0], (15.999*6+12.011*4*2.9)/(15.999*2+12.011*4))
+        self.assertEqual(select.masses(np.array(["CA", "CL", "HW1"])).tolist(), [12.011, 35.45, 1.008])
+        self.assertEqual(select.masses(np.array(["SOD", "POT", "CLA", "S1", "P"])).tolist(), [22.990, 39.098, 35.45, 32.06, 30.974])
+
+        # Cut residues in regions
+        gro_exp.utils.cut_gro("data/test.gro","output/cut_region.gro", region=select.Sphere([1.5, 1.5, 10], 1.5), mode="any", mol={"SOL": select.Slab("z", 9, 10)}, remove=True)
+        title, atoms, box = gro_exp.gro.read_gro("output/cut_region.gro")
+        self.assertEqual(atoms.size % 3, 0)
+
+    # Test neighbor search
+    def test_within(self):
+        title, atoms, box = gro_exp.gro.read_gro("data/test.gro")
+        solute = atoms["pos"][atoms["resname"] == "BEN"]
+        water = atoms["resname"] == "SOL"
+
+        # Compare to all pair distances
+        diff = atoms["pos"][:, None, :] - solute[None, :, :]
+        diff -= box * np.round(diff/box)
+        near = np.any(np.sqrt(np.sum(diff**2, axis=2)) <= 0.5, axis=1)
+        cells = gro_exp.select.CellList(solute, 0.5, box)
+        self.assertTrue(np.array_equal(cells.within(atoms["pos"]), near))
+        self.assertEqual(sum(point.size for point, index, dist in cells.pairs(atoms["pos"], 0.3)), np.sum(np.sqrt(np.sum(diff**2, axis=2)) <= 0.3))
+
+        # Remove water around the solute
+        gro_exp.utils.cut_gro("data/test.gro", "output/cut_within.gro", mol={"SOL": gro_exp.select.Within(solute, 0.5)}, remove=True, mode="any")
+        title, atoms_cut, box = gro_exp.gro.read_gro("output/cut_within.gro")
+        near_res = gro_exp.select.select(atoms, gro_exp.select.Within(solute, 0.5), "any", box)
+        self.assertEqual(atoms_cut.size, atoms.size - np.sum(near_res & water))
+
+        # Whole box including atoms on the box boundaries
+        atoms["pos"][0, 2] = 0
+        gro_exp.gro.write_gro("output/boundary.gro", atoms, box)
+        gro_exp.utils.cut_gro("output/boundary.gro", "output/cut_all.gro", area=None, stream=True, chunk_size=100)
+        self.assertEqual(gro_exp.gro.read_gro("output/cut_all.gro")[1].size, atoms.size)
+
+    # Test gro reader
+    def test_read_gro(self):
+        title, atoms, box = gro_exp.gro.read_gro("data/test.gro")
+        self.assertEqual(title, "Benzene slab in water")
+        self.assertEqual(atoms.size, 624)
+        self.assertEqual(atoms["resname"][0], "BEN")
+        self.assertEqual(atoms["atomname"][-1], "HW2")
+        self.assertEqual(atoms["resid"][-1], 184)
+        self.assertEqual(list(atoms["pos"][0]), [2.015, 2.692, 11.103])
+        self.assertEqual(list(box), [3, 3, 20])
+        self.assertNotIn("vel", atoms.dtype.names)
+
+        # Varying line lengths and velocities
+        with open("output/vel.gro", "w") as file_out:
+            file_out.write("Velocities\n    2\n")
+            file_out.write("    1SOL     OW    1   0.126   1.624   1.679  0.1000 -0.2000  0.3000\n")
+            file_out.write("    1SOL    HW1    2   0.190   1.661   1.747  1.0000  2.0000 -3.0000   \n")
+            file_out.write("   1.86206   1.86206   1.86206\n")
+        title, atoms, box = gro_exp.gro.read_gro("output/vel.gro")
+        self.assertEqual(list(atoms["vel"][1]), [1, 2, -3])
+        self.assertEqual(list(atoms["atomid"]), [1, 2])
+        title, atoms, box = gro_exp.gro.read_gro("output/vel.gro", velocities=False)
+        self.assertNotIn("vel", atoms.dtype.names)
     
+    # Test gro writer
+    def test_write_gro(self):
+        title, atoms, box = gro_exp.gro.read_gro("data/test.gro")
+        gro_exp.gro.write_gro("output/write.gro", atoms, box, title, renumber=False)
+        with open("data/test.gro", "r") as file_a, open("output/write.gro", "r") as file_b:
+            self.assertEqual(file_a.readlines()[2:], file_b.readlines()[2:])
+
+        # Negative zeros in positions and velocities
+        lines = ["Negative zeros\n", "2\n",
+                 "    1BEN     C6    1  -0.000   1.624   1.679 -0.0000  0.0000 -0.2000\n",
+                 "    1BEN     H6    2   0.190  -0.000  20.000  1.0000 -0.0000  0.0000\n",
+                 "   3.00000   3.00000  20.00000\n"]
+        with open("output/zero.gro", "w") as file_out:
+            file_out.write("".join(lines))
+        title_zero, atoms_zero, box_zero = gro_exp.gro.read_gro("output/zero.gro")
+        self.assertTrue(np.signbit(atoms_zero["pos"][0, 0]) and np.signbit(atoms_zero["vel"][1, 1]))
+        gro_exp.gro.write_gro("output/zero_write.gro", atoms_zero, box_zero, title_zero)
+        with open("output/zero_write.gro", "rb") as file_in:
+            self.assertEqual(file_in.read(), "".join(lines).encode())
+
+        # Cut output as written by the line based implementation
+        gro_exp.utils.cut_gro("output/zero.gro", "output/zero_cut.gro", area=[-1, 21])
+        with open("output/zero_cut.gro", "rb") as file_in:
+            self.assertEqual(file_in.read(), "".join(lines[:2] + [line[:44] + "\n" for line in lines[2:4]] + lines[4:]).encode())
+
+        # Velocities
+        vel = np.zeros(atoms.size, dtype=gro_exp.gro.gro_dtype(velocities=True))
+        for name in atoms.dtype.names:
+            vel[name] = atoms[name]
+        vel["vel"] = np.linspace(-1, 1, atoms.size*3).reshape(-1, 3)
+        gro_exp.gro.write_gro("output/write_vel.gro", vel, box, title)
+        title, atoms_vel, box = gro_exp.gro.read_gro("output/write_vel.gro")
+        self.assertTrue(np.allclose(atoms_vel["vel"], vel["vel"], atol=5e-5))
+
+        # Wraparound of residue and atom numbers
+        atoms = np.resize(atoms, 100001)
+        atoms["resid"] = np.arange(100001)
+        gro_exp.gro.write_gro("output/write_wrap.gro", atoms, box)
+        title, atoms, box = gro_exp.gro.read_gro("output/write_wrap.gro")
+        self.assertEqual(list(atoms["atomid"][[0, 99998, 99999, 100000]]), [1, 99999, 0, 1])
+        self.assertEqual(list(atoms["resid"][[0, 99998, 99999, 100000]]), [1, 99999, 0, 1])
+
+        # Values exceeding the field width
+        atoms["pos"][-1] = [-1.5, 10000, 0]
+        gro_exp.gro.write_gro("output/write_wide.gro", atoms, box)
+        with open("output/write_wide.gro", "r") as file_in:
+            self.assertEqual(file_in.readlines()[-2], "    1SOL    HW1    1  -1.50010000.000   0.000\n")
+
+    # Test multi-frame gro files
+    def test_gro_trajectory(self):
+        title, atoms, box = gro_exp.gro.read_gro("data/test.gro")
+        with open("output/traj.gro", "w") as file_out:
+            for frame in range(10):
+                atoms["pos"] += 0.01
+                gro_exp.gro.write_gro("output/frame.gro", atoms, box, "t= %i" % frame)
+                with open("output/frame.gro", "r") as file_in:
+                    file_out.write(file_in.read())
+
+        if os.path.isfile("output/traj.gro.idx.npz"):
+            os.remove("output/traj.gro.idx.npz")
+        traj = gro_exp.gro.GroTrajectory("output/traj.gro")
+        self.assertFalse(os.path.isfile("output/traj.gro.idx.npz"))
+        traj.close()
+        traj = gro_exp.gro.GroTrajectory("output/traj.gro", cache=True)
+        self.assertEqual(len(traj), 10)
+        self.assertEqual(traj[3][0], "t= 3")
+        self.assertEqual([frame[0] for frame in traj[1:8:3]], ["t= 1", "t= 4", "t= 7"])
+        self.assertTrue(np.allclose(traj[-1][1]["pos"], atoms["pos"]))
+        self.assertEqual(list(traj[-1][2]), [3, 3, 20])
+        self.assertTrue(os.path.isfile("output/traj.gro.idx.npz"))
+        traj.close()
+
+        # Cached index
+        with gro_exp.gro.GroTrajectory("output/traj.gro", cache=True) as traj:
+            self.assertEqual(len(traj[::2]), 5)
+            self.assertEqual(list(traj.num_atoms), [624]*10)
+
     # Test functions to read msd and
     def test_gromacs_analyse(self):
 
@@ -47,6 +225,316 @@ class UserModelCase(unittest.TestCase):
         data_msd = gro_exp.utils.msd("data/msd.xvg", is_print=True, is_plot=True)
         gro_exp.utils.msd_fit(data_msd, area=[0,5], is_print=True, is_plot=True)
 
+        # Least squares fit and detection of the diffusive regime
+        diff, error, area, interval = gro_exp.utils.msd_fit(data_msd, area="auto", is_print=True, full_output=True)
+        self.assertAlmostEqual(diff*1e9, 2.0588, delta=0.1)
+        self.assertLess(error, 0.01*diff)
+        self.assertAlmostEqual(gro_exp.utils.msd_fit(data_msd, area=area), diff, delta=0.01*diff)
+
+        # Straight line after a quadratic regime
+        x = np.arange(1, 201, dtype=float)
+        y = np.where(x < 50, x**2/50, x) + 0.01*np.sin(x)
+        start, end, slope, intercept, slope_error = gro_exp.stats.linear_regime(x, y)
+        self.assertGreaterEqual(x[start], 50)
+        self.assertAlmostEqual(slope, 1, places=2)
+        self.assertTrue(np.allclose(gro_exp.stats.linear_fit(x, x*2+1), (2, 1, 0)))
+
+        # Window sums keep their precision on long series
+        x = np.arange(200000, dtype=float)
+        y = 0.012*x + np.random.default_rng(0).normal(0, 0.01, x.size)
+        start, end, slope, intercept, slope_error = gro_exp.stats.linear_regime(x, y, exponent=None)
+        self.assertEqual((start, end), (0, x.size))
+        self.assertTrue(np.allclose((slope, intercept, slope_error), gro_exp.stats.linear_fit(x, y), rtol=1e-6))
+        self.assertEqual(gro_exp.stats.linear_regime(x, y, exponent=None, max_points=None)[:2], (0, x.size))
+
+        # Search on block means of long series
+        x = np.arange(1, 20001, dtype=float)/100
+        y = np.where(x < 50, x**2/50, x) + np.random.default_rng(1).normal(0, 0.01, x.size)
+        start, end, slope, intercept, slope_error = gro_exp.stats.linear_regime(x, y, max_points=2000)
+        self.assertGreaterEqual(x[start], 50)
+        self.assertEqual(start % 10, 0)
+        self.assertTrue(np.allclose((slope, intercept, slope_error), gro_exp.stats.linear_fit(x[start:end], y[start:end])))
+        self.assertAlmostEqual(slope, 1, places=3)
+        slope, intercept, slope_error = gro_exp.stats._window_fits(np.zeros(20), np.arange(20.0), 10)
+        self.assertTrue(np.all(np.isnan(slope_error)))
+
+    # Test MSD from coordinates
+    def test_msd_fft(self):
+        # Random walk over periodic boundaries
+        title, atoms, box = gro_exp.gro.read_gro("data/test.gro")
+        steps = np.random.default_rng(0).normal(scale=0.05, size=(20, atoms.size, 3))
+        steps[0] = 0
+        pos = atoms["pos"]+np.cumsum(steps, axis=0)
+        with open("output/msd_traj.gro", "w") as file_out:
+            for k in range(20):
+                atoms["pos"] = pos[k] % box[:3]
+                gro_exp.gro.write_gro("output/msd_frame.gro", atoms, box, "Random walk t= %.5f" % (2*k))
+                with open("output/msd_frame.gro") as file_in:
+                    file_out.write(file_in.read())
+
+        time, msd, msd_particle = gro_exp.analysis.msd_fft("output/msd_traj.gro", chunk_size=100, per_particle=True)
+        pos = gro_exp.analysis.unwrap([frame[1]["pos"] for frame in gro_exp.gro.GroTrajectory("output/msd_traj.gro")], box)
+        msd_direct = [np.mean(np.sum((pos[lag:]-pos[:20-lag])**2, axis=2)) for lag in range(20)]
+        self.assertEqual(list(time[:3]), [0, 2, 4])
+        self.assertEqual(msd_particle.shape, (20, 624))
+        self.assertTrue(np.allclose(msd, msd_direct))
+        self.assertAlmostEqual(msd[1], 3*0.05**2, delta=0.0005)
+
+        # Residue centers of mass and fit
+        os.makedirs("output/tmp", exist_ok=True)
+        time, msd = gro_exp.analysis.msd_fft("output/msd_traj.gro", resname="BEN", com=True, dt=1, tmp_dir="output/tmp")
+        self.assertEqual(time[1], 1)
+        self.assertAlmostEqual(msd[1], 3*0.05**2/6, delta=0.0003)
+        self.assertGreater(gro_exp.utils.msd_fit((time, msd), area=[0, 0.01]), 0)
+
+    # Test density profile from coordinates
+    def test_density_profile(self):
+        title, atoms, box = gro_exp.gro.read_gro("data/test.gro")
+        mass = np.sum(gro_exp.select.masses(atoms["atomname"]))
+
+        # Total mass over all bins
+        length, density, density_mean = gro_exp.analysis.density_profile([(atoms, box)], bins=40)
+        self.assertEqual(length.shape, (40,))
+        self.assertAlmostEqual(length[0], 0.25)
+        self.assertAlmostEqual(np.sum(density)*np.prod(box[:3])/40/gro_exp.analysis.AMU_NM3, mass)
+
+        # Incremental over frames and residue groups
+        profile = gro_exp.analysis.DensityProfile("z", bins=40, resname="BEN")
+        for i in range(3):
+            profile.update(atoms, box)
+        self.assertEqual(profile.num_frames, 3)
+        self.assertAlmostEqual(np.sum(profile.result()[1][16:24])*np.prod(box[:3])/40/gro_exp.analysis.AMU_NM3, 24*6*12.011, places=6)
+
+        # Radial profile around the z axis
+        length, density, density_mean = gro_exp.analysis.density_profile([(atoms, box)], bins=10, radial=True)
+        self.assertAlmostEqual(length[-1], 1.425)
+        self.assertLessEqual(np.sum(density*np.pi*np.diff(np.linspace(0, 1.5, 11)**2)*20)/gro_exp.analysis.AMU_NM3, mass)
+
+        # Analysis of gro files with the area mean of density
+        length, density, density_mean = gro_exp.utils.density("data/test.gro", area=[8, 12], is_print=True, is_plot=True, kwargs_profile={"bins": 40})
+        self.assertEqual(density.shape, (40,))
+
+    # Test interval queries on density profiles
+    def test_profile_query(self):
+        length, density, density_mean = gro_exp.utils.density("data/density.xvg", area=[0, 2])
+        query = gro_exp.analysis.ProfileQuery(length, density)
+        self.assertAlmostEqual(query.mean([0, 2], exact=False), np.mean(density[np.digitize(0, length):np.digitize(2, length)]))
+
+        # Fractional bins of a step profile
+        query = gro_exp.analysis.ProfileQuery(np.arange(10)+0.5, np.column_stack((np.arange(10), np.ones(10))))
+        self.assertEqual(query.integral([0.5, 2.25]).tolist(), [0.5*0+1+0.25*2, 1.75])
+        self.assertEqual(query.integral([[-5, 20], [3, 3]]).tolist(), [[45, 10], [0, 0]])
+        self.assertEqual(query.mean([[1, 3], [2, 2.5]]).tolist(), [[1.5, 1], [2, 1]])
+        self.assertEqual(query.mean([[-5, 20], [8, 12]]).tolist(), [[4.5, 1], [8.5, 1]])
+        self.assertTrue(np.all(np.isnan(query.mean([12, 15]))))
+        self.assertRaises(ValueError, gro_exp.analysis.ProfileQuery, [0.5], [1])
+
+        # Non uniform bins
+        query = gro_exp.analysis.ProfileQuery([0.5, 1.5, 3, 5], [1, 2, 3, 4])
+        self.assertEqual(query.edges.tolist(), [0, 1, 2.25, 4, 6])
+        self.assertAlmostEqual(query.integral([0, 6]), 1+2*1.25+3*1.75+4*2)
+
+    # Test gyration radius from coordinates
+    def test_gyration(self):
+        title, atoms, box = gro_exp.gro.read_gro("data/test.gro")
+
+        # Benzene rings with a radius of 0.14 nm
+        time, gyration, gyration_mean = gro_exp.analysis.gyration([(atoms, box)], resname="BEN")
+        self.assertEqual(gyration.shape, (1, 24))
+        self.assertAlmostEqual(gyration_mean[0], 0.14, places=3)
+
+        # Molecules broken over periodic boundaries
+        shifted = atoms.copy()
+        shifted["pos"] = (shifted["pos"]+[1.4, 1.4, 0]) % box[:3]
+        frames = list(gro_exp.analysis.iter_gyration([(atoms, box), (shifted, box)]))
+        self.assertEqual(len(frames[0][1]), 184)
+        self.assertTrue(np.allclose(frames[0][1], frames[1][1]))
+
+        # Analysis of gro files
+        time, gyrate, gyrate_mean = gro_exp.utils.gyrate("data/test.gro", is_print=True, kwargs_gyration={"resname": "BEN"})
+        self.assertEqual(list(time), [0])
+        self.assertAlmostEqual(gyrate_mean, gyration_mean[0])
+
+    # Test xvg parser
+    def test_read_xvg(self):
+        data, meta = gro_exp.xvg.read_xvg("data/msd.xvg")
+        self.assertEqual(data.shape, (25001, 2))
+        self.assertEqual(meta.title, "Mean Square Displacement")
+        self.assertEqual(meta.xlabel, "Time (ps)")
+        self.assertEqual(meta.diffusion["System"], (2.0588, 0.0911, "1e-5 cm^2/s"))
+
+        data, meta = gro_exp.xvg.read_xvg("data/gyrate.xvg")
+        self.assertEqual(data.shape, (101, 5))
+        self.assertEqual(meta.legends, ["Rg", "Rg\\sX\\N", "Rg\\sY\\N", "Rg\\sZ\\N"])
+        time, gyrate, gyrate_mean = gro_exp.utils.gyrate("data/gyrate.xvg", is_print=True, is_plot=True)
+        self.assertEqual(time[0], 0)
+        self.assertAlmostEqual(gyrate_mean, np.mean(data[:, 1]))
+
+        # Data sets by legend
+        self.assertEqual(meta.column("RgX"), 2)
+        self.assertEqual(meta.column("Rg\\sZ\\N"), 4)
+        time, values, names = gro_exp.xvg.series(data, meta, ["RgY", 0])
+        self.assertTrue(values.flags["C_CONTIGUOUS"])
+        self.assertEqual(names, ["Rg\\sY\\N", "Rg"])
+        self.assertEqual(values.tolist(), data[:, [3, 1]].tolist())
+        time, gyrate, gyrate_mean = gro_exp.utils.gyrate("data/gyrate.xvg", series="all", is_plot=True)
+        self.assertEqual(gyrate.shape, (101, 4))
+        self.assertEqual(gyrate_mean.tolist(), np.mean(data[:, 1:], axis=0).tolist())
+        time, gyrate, gyrate_mean = gro_exp.utils.gyrate("data/gyrate.xvg", series="RgZ")
+        self.assertEqual(gyrate.tolist(), data[:, 4].tolist())
+        with self.assertRaises(KeyError):
+            gro_exp.xvg.series(data, meta, ["Rg2"])
+
+        # Header lines and set separators between data lines
+        with open("output/sets.xvg", "w") as file_out:
+            file_out.write("# comment\n@ s0 legend \"a\"\n1 2\n3 4\n&\n# D[ SOL] = 1.5 (+/- 0.2) (1e-5 cm^2/s)\n5 6\n")
+        data, meta = gro_exp.xvg.read_xvg("output/sets.xvg")
+        self.assertEqual(data.tolist(), [[1, 2], [3, 4], [5, 6]])
+        self.assertEqual(meta.diffusion["SOL"][0], 1.5)
+
+        # Corrupted data lines
+        for text in ["1 2\n3 x\n5 6\n", "1 2\n3 4 5\n6\n", "1 2\n3\n"]:
+            with open("output/corrupt.xvg", "w") as file_out:
+                file_out.write(text)
+            with self.assertRaises(ValueError):
+                gro_exp.xvg.read_xvg("output/corrupt.xvg")
+            with self.assertRaises(ValueError):
+                list(gro_exp.xvg.iter_xvg("output/corrupt.xvg"))
+        with self.assertRaises(ValueError):
+            gro_exp.utils.msd("data/gyrate.xvg")
+        with self.assertRaises(FileNotFoundError):
+            gro_exp.utils.msd("data/missing.xvg")
+
+    # Test chunked xvg reader and online statistics
+    def test_iter_xvg(self):
+        data, meta = gro_exp.xvg.read_xvg("data/msd.xvg")
+        chunks = list(gro_exp.xvg.iter_xvg("data/msd.xvg", chunk_size=10000, block_size=4096))
+        self.assertEqual([chunk.shape[0] for chunk in chunks], [10000, 10000, 5001])
+        self.assertEqual(np.concatenate(chunks).tolist(), data.tolist())
+        self.assertEqual(gro_exp.xvg.read_xvg_header("data/msd.xvg").title, meta.title)
+
+        # Blocks with header lines or data set separators only
+        with open("output/sets.xvg", "w") as file_out:
+            file_out.write("1 2\n3 4\n&\n@ s1 legend \"b\"\n5 6\n")
+        for block_size in [4, 8, 16]:
+            sets = list(gro_exp.xvg.iter_xvg("output/sets.xvg", chunk_size=2, block_size=block_size))
+            self.assertEqual(np.concatenate(sets).tolist(), gro_exp.xvg.read_xvg("output/sets.xvg")[0].tolist())
+
+        stats = gro_exp.stats.RunningStats()
+        means = gro_exp.stats.WindowMeans(3000)
+        for chunk in chunks:
+            stats.update(chunk)
+            means.update(chunk[:, 1])
+        self.assertEqual(stats.count, data.shape[0])
+        self.assertTrue(np.allclose(stats.mean, np.mean(data, axis=0)))
+        self.assertTrue(np.allclose(stats.std, np.std(data, axis=0, ddof=1)))
+        self.assertEqual(stats.max.tolist(), np.max(data, axis=0).tolist())
+        self.assertTrue(np.allclose(means.means, np.mean(data[:24000, 1].reshape(8, 3000), axis=1)))
+
+        length, density, density_mean = gro_exp.utils.density("data/density.xvg", area=[0, 2])
+        length, density, stream_mean = gro_exp.utils.density("data/density.xvg", area=[0, 2], is_print=True, stream=True, chunk_size=50)
+        self.assertEqual(length, [])
+        self.assertAlmostEqual(stream_mean, density_mean)
+
+    # Test error analysis of correlated series
+    def test_block_average(self):
+        # Autoregressive series with statistical inefficiency 19
+        noise = np.random.default_rng(1).normal(size=2**15)
+        series = np.zeros_like(noise)
+        for i in range(1, series.size):
+            series[i] = 0.9*series[i-1]+noise[i]
+
+        mean, error, num_eff, sizes, errors, errors_error = gro_exp.stats.block_average(series, full_output=True)
+        self.assertEqual(sizes[-1], 2**13)
+        self.assertAlmostEqual(errors[0], np.std(series, ddof=1)/np.sqrt(series.size))
+        self.assertAlmostEqual(series.size/num_eff, 19, delta=5)
+        self.assertAlmostEqual(gro_exp.stats.statistical_inefficiency(series), 19, delta=3)
+
+        # Columns of an xvg data array, uncorrelated series
+        mean, error, num_eff = gro_exp.stats.block_average(np.column_stack((series, noise)))
+        self.assertEqual(mean.shape, (2,))
+        self.assertEqual(num_eff[1], noise.size)
+        self.assertTrue(np.allclose(gro_exp.stats.statistical_inefficiency(np.column_stack((series, noise)))[1], 1, atol=0.2))
+        self.assertEqual(gro_exp.stats.statistical_inefficiency(np.full(100, 0.1)), 1)
+        self.assertEqual(gro_exp.stats.statistical_inefficiency(np.column_stack((np.full(100, 0.1), noise[:100])))[0], 1)
+
+    # Test downsampling for plots
+    def test_downsample(self):
+        x = np.linspace(0, 100, 100001)
+        y = np.sin(x)
+        y[50000] = 10
+        for method in ["lttb", "minmax"]:
+            x_plot, y_plot = gro_exp.stats.downsample(x, y, 1000, method)
+            self.assertLessEqual(x_plot.size, 1000)
+            self.assertTrue(np.all(np.diff(x_plot) > 0))
+            self.assertEqual([x_plot[0], x_plot[-1], np.max(y_plot)], [0, 100, 10])
+        self.assertEqual(gro_exp.stats.downsample(x[:10], y[:10], 1000)[0].size, 10)
+        self.assertRaises(ValueError, gro_exp.stats.downsample, x, y, 3, "minmax")
+
+        # Missing values
+        y[1000:30000:7] = np.nan
+        y[60000:70000] = np.nan
+        for method, num_points in [("lttb", 20), ("minmax", 20), ("lttb", 1000)]:
+            x_plot, y_plot = gro_exp.stats.downsample(x, y, num_points, method)
+            self.assertEqual(x_plot.size, num_points)
+            self.assertEqual(np.nanmax(y_plot), 10)
+
+        # Analysis on the full series
+        data_msd = gro_exp.utils.msd("data/msd.xvg", is_plot=True, plot_points=500)
+        self.assertEqual(len(data_msd[0]), 25001)
+        self.assertEqual(gro_exp.utils.msd_fit(data_msd, area=[2, 8], is_plot=True, plot_points=500), gro_exp.utils.msd_fit(data_msd, area=[2, 8]))
+
+    # Test batch reader
+    def test_read_xvg_batch(self):
+        data, meta = gro_exp.xvg.read_xvg("data/gyrate.xvg")
+        for i in range(3):
+            np.savetxt("output/replica_%i.xvg" % i, np.column_stack((data[:, 0], data[:, 1:]+i)))
+        np.savetxt("output/replica_3.xvg", np.column_stack((data[:50, 0], data[:50, 1:]+3)))
+
+        stacked, mean, std = gro_exp.xvg.read_xvg_batch("output/replica_[0-2].xvg", workers=2)
+        self.assertEqual(stacked.shape, (3, 101, 5))
+        self.assertTrue(np.allclose(mean[:, 1:], data[:, 1:]+1))
+        self.assertTrue(np.allclose(std[:, 1:], 1))
+        self.assertTrue(np.allclose(std[:, 0], 0))
+
+        files = ["output/replica_%i.xvg" % i for i in range(4)]
+        replicas, mean, std = gro_exp.xvg.read_xvg_batch(files, processes=True, stack=False)
+        self.assertEqual(list(replicas), files)
+        self.assertEqual(replicas[files[3]].shape, (50, 5))
+        self.assertTrue(np.allclose(mean[:, 1:], data[:50, 1:]+1.5))
+        with self.assertRaises(ValueError):
+            gro_exp.xvg.read_xvg_batch(files)
+
+    # Test cache of parsed files
+    def test_cache(self):
+        cache = gro_exp.cache.enable("output/cache", memory_items=1)
+        cache.clear()
+        data, meta = gro_exp.xvg.read_xvg("data/gyrate.xvg")
+        for i in range(2):
+            cached, cached_meta = cache.read_xvg("data/gyrate.xvg")
+            self.assertEqual(cached.tolist(), data.tolist())
+            self.assertEqual(cached_meta.legends, meta.legends)
+            self.assertFalse(cached.flags.writeable)
+        title, atoms, box = cache.read_gro("data/test.gro")
+        title, atoms, box = gro_exp.cache.Cache("output/cache").read_gro("data/test.gro")
+        self.assertIsInstance(atoms, np.memmap)
+        self.assertTrue(np.array_equal(atoms, gro_exp.gro.read_gro("data/test.gro")[1]))
+        self.assertEqual(len(os.listdir("output/cache")), 4)
+
+        # Analysis functions through the cache
+        gro_exp.utils.cut_gro("data/test.gro", "output/cut_cache.gro", area=[8, 12])
+        gro_exp.cache.disable()
+        gro_exp.utils.cut_gro("data/test.gro", "output/cut_plain.gro", area=[8, 12])
+        with open("output/cut_cache.gro") as file_1, open("output/cut_plain.gro") as file_2:
+            self.assertEqual(file_1.read(), file_2.read())
+
+        # Least recently used entries are removed first
+        gro_size = sum(os.path.getsize(os.path.join("output/cache", name)) for name in os.listdir("output/cache") if name.startswith("gro"))
+        cache.evict(gro_size)
+        self.assertEqual({name[:3] for name in os.listdir("output/cache")}, {"gro"})
+        cache.clear()
+        self.assertEqual(os.listdir("output/cache"), [])
+
     # Test function to read DDB Data Bank
     def test_ddb(self):
         # Set the tempature area
@@ -65,6 +553,78 @@ class UserModelCase(unittest.TestCase):
         # Plot new data dictonary
         gro_exp.ddb.plot_means(data)
 
+    def test_ddb_dataset(self):
+        dataset = gro_exp.ddb.DDBDataset("data/benzene_exp_density.xls")
+        self.assertEqual(dataset.units["DEN"], "kg/m3")
+        self.assertIn("DEN", dataset.properties)
+        self.assertEqual(dataset.values["T"].dtype, float)
+        self.assertEqual(dataset.values.shape[0], 7357)
+        self.assertTrue(dataset.citation(70).startswith("Tugarev"))
+        self.assertEqual(dataset.references.at[70, "Authors"], ["Tugarev I.A.", "Avdus Z.I.", "Nozdrev V.F."])
+        self.assertEqual(dataset.references.at[70, "Year"], 1975)
+        refs = dataset.cite([78, 70, 78])
+        self.assertEqual(list(refs["Year"]), [1971, 1975, 1971])
+        self.assertEqual(refs["Citation"].iloc[1], dataset.citation(70))
+
+        # Queries from memory equal to reading the file
+        table = dataset.query("DEN", 298.15, 101325, tol_temp=0.2, tol_p=10000, p_nan=True)
+        mean, std, unit, data_amount, prop_vec, ref_vec, table_file = gro_exp.ddb.read_exp("data/benzene_exp_density.xls", "DEN", 298.15, 101325, 0.2, 10000, p_nan=True)
+        self.assertEqual(list(table["DEN"]), prop_vec)
+        self.assertEqual(gro_exp.ddb.read_exp(dataset, "DEN", 298.15, 101325, 0.2, 10000, p_nan=True)[5], ref_vec)
+        self.assertTrue(np.all(dataset.query("DEN", 298.15, area=[870, 875])["DEN"].between(870, 875)))
+
+        # Temperature grid in one query
+        temp_vec = np.linspace(280.15, 300.15, 21)
+        mean, std, count, offsets, index = dataset.query_grid("DEN", temp_vec, 101325, 0.2, 10000, p_nan=True)
+        self.assertEqual(offsets[-1], index.size)
+        for i, temp in enumerate(temp_vec):
+            table = dataset.query("DEN", temp, 101325, 0.2, 10000, p_nan=True)
+            self.assertEqual(count[i], table.shape[0])
+            self.assertEqual(list(dataset.values.index[index[offsets[i]:offsets[i+1]]]), list(table.index))
+            if count[i]:
+                self.assertTrue(np.isclose(mean[i], table["DEN"].mean()))
+                self.assertTrue(np.isclose(std[i], table["DEN"].std(ddof=0)))
+
+    def test_ddb_cache(self):
+        shutil.rmtree("output/ddb_cache", ignore_errors=True)
+        dataset = gro_exp.ddb.DDBDataset("data/benzene_exp_density.xls")
+        gro_exp.ddb.DDBDataset("data/benzene_exp_density.xls", cache="output/ddb_cache")
+        self.assertEqual(len(os.listdir("output/ddb_cache")), 1)
+
+        # Load from the cache without parsing the workbook
+        cached = gro_exp.ddb.DDBDataset.__new__(gro_exp.ddb.DDBDataset)
+        cached.filename, cached._cache = "data/benzene_exp_density.xls", "output/ddb_cache"
+        self.assertTrue(cached._load_cache())
+        pd.testing.assert_frame_equal(cached.values, dataset.values, check_index_type=False)
+        pd.testing.assert_frame_equal(cached.references, dataset.references)
+        self.assertEqual(cached.units, dataset.units)
+        self.assertEqual(gro_exp.ddb.read_exp("data/benzene_exp_density.xls", "DEN", 298.15, 101325, 0.2, 10000, p_nan=True, cache="output/ddb_cache")[:6],
+                         gro_exp.ddb.read_exp(dataset, "DEN", 298.15, 101325, 0.2, 10000, p_nan=True)[:6])
+
+        # Schema changes invalidate the cache
+        gro_exp.ddb.CACHE_VERSION += 1
+        self.assertFalse(cached._load_cache())
+        gro_exp.ddb.CACHE_VERSION -= 1
+
+    def test_ddb_bulk(self):
+        temp_vec = np.linspace(280.15, 300.15, 21)
+        manifest = [{"filename": "data/benzene_exp_density.xls", "prop": "DEN", "temp_vec": temp_vec, "press": 101325, "p_nan": False},
+                    {"filename": "data/formic_acid_diffusion.xls", "prop": "DIF", "temp_vec": temp_vec, "press": 101325},
+                    {"filename": "data/formic_acid_diffusion.xls", "prop": "DIF", "temp_vec": [298.15], "press": 101325, "p_nan": False},
+                    {"filename": "data/missing.xls", "prop": "DEN", "temp_vec": [298.15]},
+                    {"prop": "DEN", "temp_vec": [298.15]}]
+        table, errors = gro_exp.ddb.read_exp_bulk(manifest, workers=2)
+        self.assertEqual(table.shape[0], 2*temp_vec.size)
+        self.assertEqual(list(errors["Entry"]), [2, 3, 4])
+        self.assertIn("No filename", errors["Error"].iloc[2])
+
+        # Same values as for single files
+        for entry, prop, p_nan in [(0, "DEN", False), (1, "DIF", True)]:
+            data, prop_dict = gro_exp.ddb.read_exp_temp_vec(manifest[entry]["filename"], temp_vec, prop, 101325, p_nan=p_nan, is_plot=False)
+            rows = table[table["Entry"] == entry]
+            self.assertTrue(np.allclose(rows["Mean"], np.array(data[prop + " (" + rows["Unit"].iloc[0] + ")"], dtype=float), equal_nan=True))
+            self.assertEqual(list(rows["References"]), data["References"])
+
     def test_ddb_diff(self):
         # Set the tempature area
         temp_vec = np.linspace(280.15,300.15,21)
@@ -103,6 +663,57 @@ class UserModelCase(unittest.TestCase):
         diff = [1.67,1.8,1.84]
 
         gro_exp.utils.diff_inf_fit(diff, x, x="number", area = [], is_plot = True, is_print = False, kwargs_line={}, kwargs_scatter = {})
+
+        # Batched fit of many systems
+        intercept, error = gro_exp.utils.diff_inf_fit(diff, x, x="number")
+        reg = scipy.stats.linregress(np.array(x, dtype=float)**(-1/3), diff)
+        self.assertAlmostEqual(intercept, reg.intercept)
+        self.assertAlmostEqual(error, reg.intercept_stderr)
+        intercepts, errors, residuals = gro_exp.utils.diff_inf_batch([diff, [2*d for d in diff], [1.5, 1.6, np.nan]], x, x="number")
+        self.assertTrue(np.allclose(intercepts[:2], [reg.intercept, 2*reg.intercept]))
+        self.assertTrue(np.allclose(errors[:2], [reg.intercept_stderr, 2*reg.intercept_stderr]))
+        self.assertEqual(residuals.shape, (3, 3))
+        self.assertTrue(np.isnan(residuals[2, 2]))
+
+        # Analytic correction of Yeh and Hummer for water at 298 K
+        box = np.array([3, 4, 6])
+        diff_pbc = 2.3e-9-2.837297*1.380649e-23*298/(6*np.pi*0.89e-3*box*1e-9)
+        intercepts, errors, residuals = gro_exp.utils.diff_inf_batch([diff_pbc, diff_pbc], box, viscosity=[0.89e-3, 0.89e-3], temp=298)
+        self.assertTrue(np.allclose(intercepts, 2.3e-9, rtol=1e-12, atol=0))
+        self.assertTrue(np.allclose(residuals, 0, atol=1e-20))
+
+        # Bootstrap confidence intervals
+        intercept, error, interval = gro_exp.utils.diff_inf_fit(diff, x, x="number", bootstrap=1000, seed=1, is_print=True, full_output=True)
+        self.assertTrue(interval[0] <= intercept <= interval[1])
+        self.assertGreater(error, 0)
+        self.assertEqual(len(gro_exp.utils.diff_inf_fit(diff, x, x="number", bootstrap=1000, seed=1)), 2)
+        intercept, error, interval = gro_exp.utils.diff_inf_fit(diff, x, x="number", full_output=True)
+        self.assertTrue(interval[0] < intercept < interval[1])
+
+        # Bounded memory for many resamples
+        x_long = np.linspace(0, 10, 1000)
+        y_long = 2*x_long+1+np.random.default_rng(5).normal(scale=0.5, size=x_long.size)
+        self.assertTrue(np.allclose(gro_exp.stats.bootstrap_linear_fit(x_long, y_long, 300, block_size=7, seed=6)[0],
+                                    gro_exp.stats.bootstrap_linear_fit(x_long, y_long, 300, block_size=7, seed=6, chunk_size=1000)[0]))
+
+        x = np.linspace(0, 10, 200)
+        y = 2*x+1+np.random.default_rng(2).normal(scale=0.5, size=x.size)
+        slope, intercept = gro_exp.stats.bootstrap_linear_fit(x, y, num_samples=4000, seed=3)
+        reg = gro_exp.stats.linear_fit(x, y)
+        self.assertAlmostEqual(slope[0], reg[0], places=2)
+        self.assertAlmostEqual(slope[1], reg[2], delta=0.2*reg[2])
+        self.assertTrue(slope[2] < 2 < slope[3] and intercept[2] < 1 < intercept[3])
+
+        data_msd = gro_exp.utils.msd("data/msd.xvg")
+        diff, error, area, interval = gro_exp.utils.msd_fit(data_msd, area=[2, 8], bootstrap=500, seed=4, is_print=True, full_output=True)
+        self.assertTrue(interval[0] < diff < interval[1])
+        with self.assertRaises(ValueError):
+            gro_exp.utils.msd_fit(data_msd, area=[200, 300])
+
+        # Exact line without residuals
+        time = np.arange(0, 10001, 2)
+        diff, error, area, interval = gro_exp.utils.msd_fit((time, 6e-3*time), area=[2, 8], bootstrap=100, seed=4, full_output=True)
+        self.assertAlmostEqual(diff*1e9, 1)
         
 if __name__ == '__main__':
     unittest.main(verbosity=2)